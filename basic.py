@@ -1,14 +1,278 @@
+import mmap
+import os
+import threading
+
 import lexer
 import parser
+import optimizer
 import interpreter
+import compiler
+import vm
+import pycompiler
+import vectorize
+import instrument
+import filecache
+import snapshot
+from cache import CompileCache
+from instrument import run_phase
+from position import MappedText
+
+
+ENGINE_INTERPRETER = "interpreter"
+ENGINE_VM = "vm"
+ENGINE_PYTHON = "python"
+ENGINES = (ENGINE_INTERPRETER, ENGINE_VM, ENGINE_PYTHON)
 
+COMPILE_CACHE = CompileCache()
 
-def run(f_name, text):
-    tokens, token_error = lexer.exec_lexer(f_name, text)
+
+def compile_program(f_name, text, engine=ENGINE_INTERPRETER, optimize=False, observer=None):
+    tokens, token_error = run_phase(observer, "lex", instrument.count_tokens, lexer.exec_lexer, f_name, text)
     if token_error:
         return None, token_error
-    ast = parser.exec_parser(tokens)
+    ast = run_phase(observer, "parse", instrument.count_nodes, parser.exec_parser, tokens)
     if ast._error:
         return None, ast._error
-    result, error = interpreter.exec_interpreter(ast)
-    return result, error
+    if optimize:
+        ast = run_phase(observer, "optimize", instrument.count_nodes, optimizer.exec_optimizer, ast)
+    if engine == ENGINE_VM:
+        return run_phase(observer, "compile", instrument.count_instructions, compiler.exec_compiler, ast), None
+    if engine == ENGINE_PYTHON:
+        # The Python function itself is compiled on the first run
+        return run_phase(observer, "compile", instrument.count_nothing, pycompiler.exec_pycompiler, ast), None
+    return ast, None
+
+
+def execute_program(program, context, engine=ENGINE_INTERPRETER, observer=None, budget=None):
+    if engine == ENGINE_VM:
+        return run_phase(observer, engine, instrument.count_executed, vm.exec_vm, program, context, budget)
+    if engine == ENGINE_PYTHON:
+        return run_phase(
+            observer, engine, instrument.count_nothing, pycompiler.exec_pyprogram, program, context, budget
+        )
+    if observer is None:
+        return interpreter.exec_interpreter(program, context, None, budget)
+    return run_phase(
+        observer, engine, instrument.count_visits,
+        interpreter.exec_interpreter, program, context, instrument.CountingInterpreter(), budget
+    )
+
+
+def parse_statements(token_stream, observer=None):
+    # ParseResults of newline separated statements, each parsed as it is
+    # asked for. A lexer error ends the statements as a failed ParseResult
+    if observer is None:
+        statements = parser.exec_stream_parser(token_stream.iter_tokens())
+    else:
+        tokens = instrument.CountingIterator(token_stream.iter_tokens())
+        parsed = parser.exec_stream_parser(tokens)
+        count = instrument.stream_counter(tokens)
+        # Each statement is parsed, and its tokens lexed, when the loop asks for it
+        statements = iter(lambda: run_phase(observer, "parse", count, next, parsed, None), None)
+    for ast in statements:
+        if token_stream.get_error():
+            break
+        yield ast
+        if ast._error:
+            return
+    if token_stream.get_error():
+        yield parser.ParseResult().failed(token_stream.get_error())
+
+
+def execute_trees(statements, context, engine=ENGINE_INTERPRETER, optimize=False, observer=None, budget=None):
+    # Runs the ParseResults of statements one by one, yielding (result, error)
+    # per statement and stopping at the first error
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+    for ast in statements:
+        if ast._error:
+            yield None, ast._error
+            return
+        if optimize:
+            ast = run_phase(observer, "optimize", instrument.count_nodes, optimizer.exec_optimizer, ast)
+        if engine == ENGINE_VM:
+            program = run_phase(observer, "compile", instrument.count_instructions, compiler.exec_compiler, ast)
+        elif engine == ENGINE_PYTHON:
+            program = run_phase(observer, "compile", instrument.count_nothing, pycompiler.exec_pycompiler, ast)
+        else:
+            program = ast
+        result, error = execute_program(program, context, engine, observer, budget)
+        yield result, error
+        if error:
+            return
+
+
+def execute_statements(token_stream, context, engine=ENGINE_INTERPRETER, optimize=False, observer=None, budget=None):
+    # Runs newline separated statements one by one as soon as each is parsed
+    yield from execute_trees(parse_statements(token_stream, observer), context, engine, optimize, observer, budget)
+
+
+def load_statements(f_name, text, disk_cache, observer=None):
+    # ParseResults of the statements of text, read from the disk cache (see
+    # filecache.py) when it has them. When it has not, each is parsed when it
+    # is asked for and the cache is written once the last one is
+    statements = run_phase(observer, "disk_cache", instrument.count_disk_cache, disk_cache.load, f_name, text)
+    if statements is not None:
+        yield from statements
+        return
+    columns = filecache.tree_columns(text)
+    ast = None
+    for ast in parse_statements(lexer.Lexer(f_name, text), observer):
+        if not ast._error:
+            # Before the statement runs, optimize and resolve change its tree
+            columns.dump(ast._node)
+        yield ast
+    if ast is None or not ast._error:
+        disk_cache.store_columns(text, columns)
+
+
+def load_program(f_name, text, engine, optimize, cache, observer=None):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+    if cache is None:
+        return compile_program(f_name, text, engine, optimize, observer)
+    key = (f_name, text, engine, optimize)
+    if observer is None:
+        return cache.get_or_compile(key, lambda: compile_program(f_name, text, engine, optimize))
+    # The same steps as get_or_compile, with the lookup reported as a phase
+    entry = run_phase(observer, "cache", instrument.count_cache, cache.get, key)
+    if entry is None:
+        entry = compile_program(f_name, text, engine, optimize, observer)
+        cache.put(key, entry)
+    return entry
+
+
+def map_file(path):
+    # The file is memory mapped and lexed in place, so a large script is never
+    # copied into a Python string
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return MappedText(b"")
+        # The mapping stays valid after the file is closed, and is released
+        # once no Position (error, stored Number) refers to it anymore
+        return MappedText(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class Session:
+    # A session owns a program context and global symbol table, so variables
+    # assigned in one session are never seen by another. Sessions share the
+    # read-only interpreter.BUILTINS and the compile cache (compiled programs
+    # hold no variable values), so separate sessions run concurrently in
+    # separate threads without any lock between them. A lock per session
+    # keeps concurrent runs in the same session from interleaving. The
+    # observer (see instrument.py) is told about the phases of every run,
+    # and the limits (see limits.py) bound the work of every call, unless a
+    # call is given an observer / limits of its own
+
+    def __init__(self, symbol_table=None, observer=None, limits=None):
+        if symbol_table is None:
+            symbol_table = interpreter.make_global_symbol_table()
+        self._context = interpreter.make_program_context(symbol_table)
+        self._lock = threading.Lock()
+        self._observer = observer
+        self._limits = limits
+
+    def get_context(self):
+        return self._context
+
+    def get_symbol_table(self):
+        return self._context._symbol_table
+
+    def get_observer(self):
+        return self._observer
+
+    def set_observer(self, observer):
+        self._observer = observer
+
+    def get_limits(self):
+        return self._limits
+
+    def set_limits(self, limits):
+        self._limits = limits
+
+    def save_snapshot(self, path):
+        # The variables of the session (see snapshot.py), saved between runs
+        with self._lock:
+            snapshot.save(self._context._symbol_table, path)
+
+    def start_budget(self, limits):
+        # Budget of one call, None when neither the call nor the session has limits
+        if limits is None:
+            limits = self._limits
+        return None if limits is None else limits.start()
+
+    def run(self, f_name, text, engine=ENGINE_INTERPRETER, optimize=False, cache=COMPILE_CACHE, observer=None,
+            limits=None):
+        if observer is None:
+            observer = self._observer
+        # The time limit starts before the compile cache is looked up
+        budget = self.start_budget(limits)
+        program, error = load_program(f_name, text, engine, optimize, cache, observer)
+        if error:
+            return None, error
+        with self._lock:
+            return execute_program(program, self._context, engine, observer, budget)
+
+    def run_stream(self, f_name, text, engine=ENGINE_INTERPRETER, optimize=False, observer=None, limits=None):
+        # The lock is held while a statement runs, not while the caller
+        # holds on to its result
+        if observer is None:
+            observer = self._observer
+        budget = self.start_budget(limits)
+        statements = execute_statements(lexer.Lexer(f_name, text), self._context, engine, optimize, observer, budget)
+        return self.run_locked(statements)
+
+    def run_locked(self, statements):
+        # The (result, error) of each statement of a generator running in
+        # this session's context
+        while True:
+            with self._lock:
+                outcome = next(statements, None)
+            if outcome is None:
+                return
+            yield outcome
+
+    def run_program(self, f_name, text, engine=ENGINE_INTERPRETER, optimize=False, observer=None, limits=None):
+        # Newline separated statements, returns the last statement's (result, error)
+        result, error = None, None
+        for result, error in self.run_stream(f_name, text, engine, optimize, observer, limits):
+            pass
+        return result, error
+
+    def run_file(self, path, engine=ENGINE_INTERPRETER, optimize=False, observer=None, disk_cache=None,
+                 limits=None):
+        if disk_cache is None:
+            return self.run_program(path, map_file(path), engine, optimize, observer, limits)
+        if observer is None:
+            observer = self._observer
+        budget = self.start_budget(limits)
+        statements = load_statements(path, map_file(path), disk_cache, observer)
+        trees = execute_trees(statements, self._context, engine, optimize, observer, budget)
+        result, error = None, None
+        for result, error in self.run_locked(trees):
+            pass
+        return result, error
+
+
+# The session of the module level functions, on interpreter.GLOBAL_SYMBOL_TABLE
+# so exec_interpreter / exec_vm without a context see the same variables
+DEFAULT_SESSION = Session(interpreter.GLOBAL_SYMBOL_TABLE)
+
+
+def run(f_name, text, engine=ENGINE_INTERPRETER, optimize=False, cache=COMPILE_CACHE, observer=None, limits=None):
+    return DEFAULT_SESSION.run(f_name, text, engine, optimize, cache, observer, limits)
+
+
+def run_stream(f_name, text, engine=ENGINE_INTERPRETER, optimize=False, observer=None, limits=None):
+    return DEFAULT_SESSION.run_stream(f_name, text, engine, optimize, observer, limits)
+
+
+def run_file(path, engine=ENGINE_INTERPRETER, optimize=False, observer=None, disk_cache=None, limits=None):
+    return DEFAULT_SESSION.run_file(path, engine, optimize, observer, disk_cache, limits)
+
+
+def run_vectorized(f_name, text, bindings, optimize=False, cache=COMPILE_CACHE):
+    ast, error = load_program(f_name, text, ENGINE_INTERPRETER, optimize, cache)
+    if error:
+        return None, error
+    return vectorize.exec_vectorized(ast, bindings), None
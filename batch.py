@@ -0,0 +1,146 @@
+#########################
+# BATCH
+#########################
+
+"""
+run_batch evaluates many independent programs on a pool of worker
+processes, so a large batch is spread over every core of the machine:
+
+    >> results = batch.run_batch([("a", "VAR x = 2\nx ^ 8"), ("b", "x / 0")])
+    >> results[0]
+    (256, None)
+    >> results[1][1].as_string()
+    "Traceback (most recent call last): ... 'x' is not defined. ..."
+
+Every job runs in a basic.Session of its own, so jobs never see each
+other's variables (nor those of the caller's sessions).
+
+Jobs are sent to the workers in chunks of several jobs, one round trip
+per chunk instead of per job. Results are detached from the symbol table
+of their job before they are sent back, so only the value, its positions
+and the source travel between processes.
+
+A Python exception in a job (an OverflowError, ...) only fails that job.
+A worker process that dies breaks the whole pool, and the chunks running
+on the other workers with it. Each worker is sent one chunk at a time, so
+the chunks still waiting are not broken. The broken and the waiting chunks
+run again on a new pool of the same size. A chunk that breaks a pool a
+second time is split in halves, which run again the same way, down to
+chunks of one job. A job that breaks a pool again runs alone on a pool of
+its own: if that one breaks too, the job is what kills its worker and it
+fails with a BatchError.
+"""
+
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import basic
+from errors import RTError, BatchError
+from interpreter import Context, Number
+from position import Position, Source
+
+# Chunks per worker when no chunk size is given, a few so a slow chunk does
+# not leave the other workers idle at the end of the batch
+CHUNKS_PER_WORKER = 4
+
+
+def detach_context(context):
+    # Copy of the context chain for tracebacks, without the symbol tables
+    if context is None:
+        return None
+    return Context(context._display_name, detach_context(context._parent), context._parent_entry_pos)
+
+
+def detach(result, error):
+    if result is not None:
+        result = Number(result._value).set_position(result._start_pos, result._end_pos).set_context(
+            detach_context(result._context)
+        )
+    if isinstance(error, RTError):
+        error._context = detach_context(error._context)
+    return result, error
+
+
+def job_error(f_name, text, details):
+    # Not tied to any place in the program, points at its first line
+    source = Source(f_name, text)
+    first_line_end = text.find("\n")
+    return BatchError(
+        Position(0, source), Position(len(text) if first_line_end == -1 else first_line_end, source), details
+    )
+
+
+def run_job(f_name, text, engine, optimize):
+    # A job is a whole program, newline separated statements
+    try:
+        result, error = basic.Session().run_program(f_name, text, engine, optimize)
+    except Exception as exception:
+        return None, job_error(f_name, text, f"{type(exception).__name__}: {exception}")
+    return detach(result, error)
+
+
+def run_chunk(jobs, engine, optimize):
+    return [run_job(f_name, text, engine, optimize) for f_name, text in jobs]
+
+
+def run_chunks(chunks, results, engine, optimize, max_workers):
+    # Fills in results of the chunks that finish. Returns the chunks that
+    # did not because a worker died and those not sent after that
+    broken = []
+    waiting = chunks[::-1]
+    running = {}
+    with ProcessPoolExecutor(max_workers) as pool:
+        while True:
+            # One chunk per worker at a time, a dying worker only breaks the
+            # chunks the other workers are running
+            while waiting and len(running) < max_workers and not broken:
+                try:
+                    future = pool.submit(run_chunk, waiting[-1][1], engine, optimize)
+                except BrokenProcessPool:
+                    break
+                running[future] = waiting.pop()
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, chunk = running.pop(future)
+                try:
+                    results[start:start + len(chunk)] = future.result()
+                except BrokenProcessPool:
+                    broken.append((start, chunk))
+    return broken, waiting[::-1]
+
+
+def run_batch(jobs, engine=basic.ENGINE_INTERPRETER, optimize=False, max_workers=None, chunk_size=None):
+    # jobs is a list of (f_name, text), returns one (result, error) per job, in order
+    if engine not in basic.ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(basic.ENGINES)}")
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = math.ceil(len(jobs) / (max_workers * CHUNKS_PER_WORKER))
+
+    chunks = [(start, jobs[start:start + chunk_size]) for start in range(0, len(jobs), chunk_size)]
+    # Starts of the chunks that broke a pool already, the chunks that did
+    # not finish in a broken pool are not all the one that broke it
+    suspects = set()
+    while chunks:
+        broken, chunks = run_chunks(chunks, results, engine, optimize, max_workers)
+        for start, chunk in broken:
+            if start not in suspects:
+                suspects.add(start)
+                chunks.append((start, chunk))
+            elif len(chunk) > 1:
+                half = len(chunk) // 2
+                suspects.add(start + half)
+                chunks += [(start, chunk[:half]), (start + half, chunk[half:])]
+            elif run_chunks([(start, chunk)], results, engine, optimize, 1)[0]:
+                f_name, text = chunk[0]
+                results[start] = (None, job_error(f_name, text, "Worker process died"))
+    return results
@@ -0,0 +1,69 @@
+#########################
+# MEMORY BENCHMARK
+#########################
+
+"""
+Reports how many bytes the lexer, parser and interpreter objects cost:
+
+    python benchmarks/memory.py [statements]
+
+bytes/token   tokens with their positions, as returned by exec_lexer
+bytes/node    syntax tree nodes, as built by exec_parser
+bytes/number  Number objects, as returned by exec_interpreter
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lexer  # noqa: E402
+import parser  # noqa: E402
+import interpreter  # noqa: E402
+
+DEFAULT_STATEMENTS = 20000
+
+
+def make_source(statements):
+    # One long expression so exec_parser builds a single tree
+    return " + ".join(f"(alpha_{indx % 10} * {indx} - {indx}.5 / -beta)" for indx in range(statements))
+
+
+def count_nodes(node):
+    return sum(1 for _ in parser.iter_nodes(node))
+
+
+def measure(function):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def main(statements=DEFAULT_STATEMENTS):
+    text = make_source(statements)
+
+    (tokens, error), token_bytes = measure(lambda: lexer.exec_lexer("<bench>", text))
+    if error:
+        raise SystemExit(error.as_string())
+    # The list holding the tokens is not part of their cost
+    token_bytes -= sys.getsizeof(tokens)
+
+    ast, node_bytes = measure(lambda: parser.exec_parser(tokens))
+    nodes = count_nodes(ast._node)
+
+    numbers, number_bytes = measure(lambda: [interpreter.Number(1) for _ in range(statements)])
+    number_bytes -= sys.getsizeof(numbers)
+
+    print(f"tokens  {len(tokens):>10}  {token_bytes / len(tokens):8.1f} bytes/token")
+    print(f"nodes   {nodes:>10}  {node_bytes / nodes:8.1f} bytes/node")
+    print(f"numbers {len(numbers):>10}  {number_bytes / len(numbers):8.1f} bytes/number")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STATEMENTS)
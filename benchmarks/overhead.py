@@ -0,0 +1,81 @@
+#########################
+# OVERHEAD BENCHMARK
+#########################
+
+"""
+Reports the time the parser and the tree-walking interpreter spend per
+syntax tree node on the success path:
+
+    python benchmarks/overhead.py [statements] [repeat]
+
+ns/node parse      exec_parser over already lexed tokens
+ns/node interpret  exec_interpreter over the parsed tree
+
+Both are the best of `repeat` runs over many small expressions, so the
+fixed cost of each call (result objects, error checks) is part of the
+figure, as it is when a REPL or a script runs one statement at a time.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lexer  # noqa: E402
+import parser  # noqa: E402
+import interpreter  # noqa: E402
+
+DEFAULT_STATEMENTS = 5000
+DEFAULT_REPEAT = 5
+
+
+def make_sources(statements):
+    return [
+        f"VAR v_{indx % 10} = (alpha * {indx} - {indx}.5 / -beta) ^ 2 + {indx % 7}"
+        for indx in range(statements)
+    ]
+
+
+def count_nodes(node):
+    return sum(1 for _ in parser.iter_nodes(node))
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(statements=DEFAULT_STATEMENTS, repeat=DEFAULT_REPEAT):
+    token_lists = []
+    for text in make_sources(statements):
+        tokens, error = lexer.exec_lexer("<bench>", text)
+        if error:
+            raise SystemExit(error.as_string())
+        token_lists.append(tokens)
+
+    trees = [parser.exec_parser(tokens) for tokens in token_lists]
+    nodes = sum(count_nodes(ast._node) for ast in trees)
+
+    context = interpreter.make_program_context()
+    context._symbol_table.set("alpha", interpreter.Number(3))
+    context._symbol_table.set("beta", interpreter.Number(4))
+
+    parse_time = best_time(lambda: [parser.exec_parser(tokens) for tokens in token_lists], repeat)
+    interpret_time = best_time(lambda: [interpreter.exec_interpreter(ast, context) for ast in trees], repeat)
+
+    print(f"nodes      {nodes:>10}")
+    print(f"parse      {parse_time * 1e9 / nodes:8.1f} ns/node")
+    print(f"interpret  {interpret_time * 1e9 / nodes:8.1f} ns/node")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STATEMENTS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REPEAT
+    )
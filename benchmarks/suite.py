@@ -0,0 +1,273 @@
+#########################
+# BENCHMARK SUITE
+#########################
+
+"""
+Times the lexer, parser and each evaluation engine separately over
+generated workloads, records their peak memory, and compares the figures
+with a saved JSON baseline:
+
+    python benchmarks/suite.py --save baseline.json
+    ... change the lexer / parser / interpreter ...
+    python benchmarks/suite.py --compare baseline.json [--threshold 0.1]
+
+stage        rate            input
+lex          tokens/s        the workload text
+parse        nodes/s         the tokens, one tree per statement
+interpreter  statements/s    the trees, run one after the other in one context
+vm           statements/s    the compiled bytecode of every statement
+python       statements/s    the compiled Python function of every statement
+
+Workloads are generated from a fixed seed, so a given --scale always
+produces the same inputs. Rates are the best of --repeat samples of at
+least MIN_SAMPLE_TIME each, timed in process CPU time so time spent
+descheduled on a busy machine is not counted. With --compare, a stage
+whose rate fell, or whose peak memory grew, by more than --threshold (a
+fraction) is a regression and the exit status is 1. Baselines only
+compare on the same machine and Python version.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lexer  # noqa: E402
+import parser  # noqa: E402
+import interpreter  # noqa: E402
+import compiler  # noqa: E402
+import vm  # noqa: E402
+import pycompiler  # noqa: E402
+
+SEED = 1234
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+MIN_SAMPLE_TIME = 0.2
+# Peak memory growth under this many bytes is never a regression, small
+# stages vary by a few hundred bytes from run to run
+MEMORY_FLOOR = 64 * 1024
+# Each term of a sum and each level of parentheses is one level of tree
+# depth, and the tree-walking interpreter gives up at about 500 levels
+FLAT_SUM_TERMS = 400
+NESTING_DEPTH = 300
+VARIABLES = [f"v_{indx}" for indx in range(26)]
+
+
+def flat_sum(rnd, scale):
+    return "\n".join(
+        " + ".join(str(rnd.randint(0, 999)) for _ in range(FLAT_SUM_TERMS)) for _ in range(40 * scale)
+    )
+
+
+def nested_parentheses(rnd, scale):
+    statements = []
+    for _ in range(20 * scale):
+        depth = NESTING_DEPTH
+        operators = [rnd.choice("+-*") for _ in range(depth)]
+        statements.append(
+            "".join(f"{rnd.randint(1, 9)} {operator} (" for operator in operators)
+            + "1" + ")" * depth
+        )
+    return "\n".join(statements)
+
+
+def variable_heavy(rnd, scale):
+    statements = [f"VAR {name} = {indx + 1}" for indx, name in enumerate(VARIABLES)]
+    for _ in range(1000 * scale):
+        target = rnd.choice(VARIABLES)
+        a, b, c, d, e, f = (rnd.choice(VARIABLES) for _ in range(6))
+        # The divisor is never 0, whatever the variables hold by then
+        statements.append(f"VAR {target} = ({a} + {b} * {c} - {d}) / ({e} * {e} + 1) + {f}")
+    return "\n".join(statements)
+
+
+def float_heavy(rnd, scale):
+    statements = []
+    for _ in range(1000 * scale):
+        values = [f"{rnd.uniform(0, 100):.4f}" for _ in range(8)]
+        statements.append(
+            f"({values[0]} * {values[1]} - {values[2]}) / ({values[3]} + 1.5) + {values[4]} * -{values[5]}"
+            f" - {values[6]} / {values[7]}"
+        )
+    return "\n".join(statements)
+
+
+def power_heavy(rnd, scale):
+    statements = []
+    for _ in range(1000 * scale):
+        statements.append(
+            f"{rnd.randint(2, 9)} ^ {rnd.randint(2, 30)} + {rnd.uniform(1, 3):.3f} ^ {rnd.uniform(0, 4):.3f}"
+            f" - 2 ^ 3 ^ {rnd.randint(1, 3)}"
+        )
+    return "\n".join(statements)
+
+
+def large_multiline(rnd, scale):
+    statements = []
+    for indx in range(10000 * scale):
+        name = VARIABLES[indx % len(VARIABLES)]
+        statements.append(f"VAR {name} = {rnd.randint(0, 99)} * {rnd.randint(1, 9)} - {indx % 7}")
+    return "\n".join(statements)
+
+
+WORKLOADS = {
+    "flat_sum": flat_sum,
+    "nested_parentheses": nested_parentheses,
+    "variable_heavy": variable_heavy,
+    "float_heavy": float_heavy,
+    "power_heavy": power_heavy,
+    "large_multiline": large_multiline,
+}
+
+
+def count_nodes(node):
+    return sum(1 for _ in parser.iter_nodes(node))
+
+
+def lex(text):
+    tokens, error = lexer.exec_lexer("<bench>", text)
+    if error:
+        raise SystemExit(error.as_string())
+    return tokens
+
+
+def parse(tokens):
+    trees = list(parser.exec_stream_parser(tokens))
+    for tree in trees:
+        if tree._error:
+            raise SystemExit(tree._error.as_string())
+    return trees
+
+
+def evaluate(programs, execute):
+    context = interpreter.make_program_context(interpreter.make_global_symbol_table())
+    for program in programs:
+        result, error = execute(program, context)
+        if error:
+            raise SystemExit(error.as_string())
+
+
+def make_stages(text):
+    # (stage, unit, amount of work, function) for one workload, each stage's
+    # input prepared up front so only the stage itself is timed
+    tokens = lex(text)
+    trees = parse(tokens)
+    nodes = sum(count_nodes(tree._node) for tree in trees)
+    code_objects = [compiler.exec_compiler(tree) for tree in trees]
+    py_programs = [pycompiler.exec_pycompiler(tree) for tree in trees]
+    # Python functions are compiled on their first run, that is not timed
+    evaluate(py_programs, pycompiler.exec_pyprogram)
+    return [
+        ("lex", "tokens/s", len(tokens), lambda: lex(text)),
+        ("parse", "nodes/s", nodes, lambda: parse(tokens)),
+        ("interpreter", "statements/s", len(trees), lambda: evaluate(trees, interpreter.exec_interpreter)),
+        ("vm", "statements/s", len(trees), lambda: evaluate(code_objects, vm.exec_vm)),
+        ("python", "statements/s", len(trees), lambda: evaluate(py_programs, pycompiler.exec_pyprogram)),
+    ]
+
+
+def sample_time(function, loops):
+    gc.collect()
+    start = time.process_time()
+    for _ in range(loops):
+        function()
+    return (time.process_time() - start) / loops
+
+
+def best_time(function, repeat):
+    # Like timeit's autorange: a stage is run enough times in a row for one
+    # sample to last MIN_SAMPLE_TIME, a single fast run is mostly timer noise
+    loops = 1
+    while sample_time(function, loops) * loops < MIN_SAMPLE_TIME:
+        loops *= 2
+    return min(sample_time(function, loops) for _ in range(repeat))
+
+
+def peak_memory(function):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(scale, repeat, workloads):
+    figures = {}
+    for name in workloads:
+        text = WORKLOADS[name](random.Random(SEED), scale)
+        for stage, unit, amount, function in make_stages(text):
+            elapsed = best_time(function, repeat)
+            figures[f"{name}/{stage}"] = {
+                "unit": unit,
+                "rate": amount / elapsed,
+                "peak_bytes": peak_memory(function),
+            }
+            print(f"{name:<20} {stage:<12} {amount / elapsed:>14,.0f} {unit:<13}"
+                  f" {figures[f'{name}/{stage}']['peak_bytes'] / 1024:>10,.0f} KiB peak")
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "figures": figures,
+    }
+
+
+def compare(report, baseline, threshold):
+    # Returns the number of regressions
+    if baseline["python"] != report["python"] or baseline["scale"] != report["scale"]:
+        print(f"warning: baseline is Python {baseline['python']} scale {baseline['scale']},"
+              f" this run is Python {report['python']} scale {report['scale']}")
+    regressions = 0
+    print()
+    for key, figure in report["figures"].items():
+        old = baseline["figures"].get(key)
+        if old is None:
+            continue
+        rate_change = figure["rate"] / old["rate"] - 1
+        memory_change = figure["peak_bytes"] / max(old["peak_bytes"], 1) - 1
+        memory_grown = memory_change > threshold and figure["peak_bytes"] - old["peak_bytes"] > MEMORY_FLOOR
+        failed = rate_change < -threshold or memory_grown
+        regressions += failed
+        print(f"{key:<33} rate {rate_change:>+7.1%}  memory {memory_change:>+7.1%}{'  REGRESSION' if failed else ''}")
+    return regressions
+
+
+def main():
+    arguments = argparse.ArgumentParser(description="Lexer, parser and engine benchmarks")
+    arguments.add_argument("--scale", type=int, default=1, help="size multiplier of the workloads")
+    arguments.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    arguments.add_argument("--only", help="comma separated workloads, of " + ", ".join(WORKLOADS))
+    arguments.add_argument("--save", help="write the figures to this JSON file")
+    arguments.add_argument("--compare", help="compare with the figures of this JSON file")
+    arguments.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    options = arguments.parse_args()
+
+    workloads = options.only.split(",") if options.only else list(WORKLOADS)
+    for name in workloads:
+        if name not in WORKLOADS:
+            raise SystemExit(f"Unknown workload '{name}', expected one of {', '.join(WORKLOADS)}")
+
+    report = run_suite(options.scale, options.repeat, workloads)
+    if options.save:
+        with open(options.save, "w") as file:
+            json.dump(report, file, indent=2)
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, options.threshold)
+        if regressions:
+            print(f"\n{regressions} regression(s) over {options.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
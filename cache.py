@@ -0,0 +1,86 @@
+#########################
+# COMPILE CACHE
+#########################
+
+"""
+A bounded least recently used cache for compiled programs.
+
+basic.run keys it by everything that changes the compiled output
+(file name, source text, engine, optimize flag) and stores the
+(program, error) pair, so a source that failed to lex or parse returns the
+same error again without being lexed or parsed a second time.
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 1024
+
+
+class CompileCache:
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        if max_size < 0:
+            raise ValueError("max_size must be >= 0")
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_max_size(self):
+        return self._max_size
+
+    def set_max_size(self, max_size):
+        if max_size < 0:
+            raise ValueError("max_size must be >= 0")
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get_or_compile(self, key, compile_function):
+        entry = self.get(key)
+        if entry is None:
+            # Compiling happens outside the lock so one slow source does not
+            # block every other thread; racing threads just compile twice
+            entry = compile_function()
+            self.put(key, entry)
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._entries),
+                "max_size": self._max_size,
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,212 @@
+#########################
+# COMPILER
+#########################
+
+"""
+The compiler flattens the syntax tree built by the parser into bytecode
+for the stack VM (see vm.py).
+
+Every instruction is two ints, an opcode and its argument, so the VM can
+walk the code with a plain index instead of visiting nodes:
+
+    >> VAR x = 1 + 2 * y
+
+    LOAD_CONST   0      (1)
+    LOAD_CONST   1      (2)
+    LOAD_NAME    0      (y)
+    MUL          0
+    ADD          0
+    STORE_NAME   1      (x)
+    RETURN       0
+
+Source positions are kept in a table parallel to the instructions so the VM
+can still build the same RTError as the tree-walking interpreter. MUL and
+POW have the positions of their node, for the errors of limits.py.
+
+A subexpression the optimizer found repeated (see optimizer.py) is kept in
+a temporary by STORE_TEMP after its first occurrence, and LOAD_TEMP pushes
+it again wherever it is repeated.
+"""
+
+from parser import (
+    UnaryOpNode,
+    BinaryOpNode,
+    VariableAssignNode,
+    CachedNode
+)
+from tokens import TokenTypes
+
+
+class OpCodes:
+    LOAD_CONST = 0
+    LOAD_NAME = 1
+    STORE_NAME = 2
+    ADD = 3
+    SUB = 4
+    MUL = 5
+    DIV = 6
+    POW = 7
+    NEG = 8
+    RETURN = 9
+    STORE_TEMP = 10
+    LOAD_TEMP = 11
+
+
+BINARY_OPCODES = {
+    TokenTypes.TT_PLUS: OpCodes.ADD,
+    TokenTypes.TT_MINUS: OpCodes.SUB,
+    TokenTypes.TT_MUL: OpCodes.MUL,
+    TokenTypes.TT_DIV: OpCodes.DIV,
+    TokenTypes.TT_POWER: OpCodes.POW,
+}
+
+
+def value_positions(node):
+    # An assignment evaluates to the value of its right hand side, so that is
+    # where the interpreter places the resulting Number
+    while isinstance(node, VariableAssignNode):
+        node = node.get_value_node()
+    return node.get_start_pos(), node.get_end_pos()
+
+
+class CodeObject:
+    def __init__(self, instructions, constants, names, positions, temp_count=0, node_count=0):
+        self._instructions = instructions
+        self._constants = constants
+        self._names = names
+        self._positions = positions
+        self._temp_count = temp_count
+        # Nodes of the tree it was compiled from, the steps of a run
+        self._node_count = node_count
+
+    def get_instructions(self):
+        return self._instructions
+
+    def get_constants(self):
+        return self._constants
+
+    def get_names(self):
+        return self._names
+
+    def get_positions(self):
+        return self._positions
+
+    def get_temp_count(self):
+        return self._temp_count
+
+    def get_node_count(self):
+        return self._node_count
+
+    def __repr__(self):
+        names = {value: key for key, value in vars(OpCodes).items() if not key.startswith("_")}
+        lines = []
+        for indx in range(0, len(self._instructions), 2):
+            op, arg = self._instructions[indx], self._instructions[indx + 1]
+            lines.append(f"{indx // 2:>4} {names[op]:<12} {arg}")
+        return "\n".join(lines)
+
+
+class Compiler:
+    def __init__(self):
+        self._instructions = []
+        self._constants = []
+        self._constant_indexes = {}
+        self._names = []
+        self._name_indexes = {}
+        self._positions = []
+        self._temp_count = 0
+        self._node_count = 0
+
+    def emit(self, op, arg=0, positions=None):
+        self._instructions.append(op)
+        self._instructions.append(arg)
+        self._positions.append(positions)
+
+    def constant_index(self, value):
+        # repr() keeps 0.0 / -0.0 and 1 / 1.0 apart, which a plain dict key would not
+        key = (type(value), repr(value))
+        indx = self._constant_indexes.get(key)
+        if indx is None:
+            indx = self._constant_indexes[key] = len(self._constants)
+            self._constants.append(value)
+        return indx
+
+    def name_index(self, name):
+        indx = self._name_indexes.get(name)
+        if indx is None:
+            indx = self._name_indexes[name] = len(self._names)
+            self._names.append(name)
+        return indx
+
+    def no_visit_method(self, node):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    # Each visit method emits the code of a node once its children are compiled
+
+    def visit_NumberNode(self, node):
+        self.emit(OpCodes.LOAD_CONST, self.constant_index(node.get_token().get_value()))
+
+    def visit_VariableAccessNode(self, node):
+        self.emit(
+            OpCodes.LOAD_NAME, self.name_index(node.get_token().get_value()),
+            (node.get_start_pos(), node.get_end_pos())
+        )
+
+    def visit_VariableAssignNode(self, node):
+        self.emit(OpCodes.STORE_NAME, self.name_index(node.get_token().get_value()),
+                  value_positions(node))
+
+    def visit_UnaryOpNode(self, node):
+        if node.get_token().get_type() == TokenTypes.TT_MINUS:
+            self.emit(OpCodes.NEG)
+
+    def visit_CachedNode(self, node):
+        self.emit(OpCodes.STORE_TEMP, node._index)
+        self._temp_count = max(self._temp_count, node._index + 1)
+
+    def visit_ReusedNode(self, node):
+        self.emit(OpCodes.LOAD_TEMP, node._cached._index)
+
+    def visit_BinaryOpNode(self, node):
+        op = BINARY_OPCODES[node.get_token().get_type()]
+        if op == OpCodes.DIV:
+            # Division by zero is reported at the divisor, as Number.div_by does
+            self.emit(op, 0, value_positions(node.get_right_node()))
+        elif op == OpCodes.MUL or op == OpCodes.POW:
+            self.emit(op, 0, (node.get_start_pos(), node.get_end_pos()))
+        else:
+            self.emit(op)
+
+    def compile(self, node):
+        # Post-order walk over an explicit stack, so trees nested deeper than
+        # Python's recursion limit compile too
+        stack = [(node, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                self._node_count += 1
+                method_name = f"visit_{type(node).__name__}"
+                getattr(self, method_name, self.no_visit_method)(node)
+                continue
+            stack.append((node, True))
+            if isinstance(node, BinaryOpNode):
+                stack.append((node.get_right_node(), False))
+                stack.append((node.get_left_node(), False))
+            elif isinstance(node, UnaryOpNode):
+                stack.append((node._node, False))
+            elif isinstance(node, VariableAssignNode):
+                stack.append((node.get_value_node(), False))
+            elif isinstance(node, CachedNode):
+                stack.append((node._node, False))
+
+    def finish(self, root):
+        self.emit(OpCodes.RETURN, 0, value_positions(root))
+        return CodeObject(
+            self._instructions, self._constants, self._names, self._positions, self._temp_count, self._node_count
+        )
+
+
+def exec_compiler(abstract_syntax_tree):
+    compiler = Compiler()
+    compiler.compile(abstract_syntax_tree._node)
+    return compiler.finish(abstract_syntax_tree._node)
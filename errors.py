@@ -5,20 +5,34 @@
 from helpers import string_with_arrows
 
 
-class Error:
+class Error(Exception):
+    # Raised inside the parser and interpreter, and handed to callers as the
+    # error half of a (result, error) pair once caught
     def __init__(self, pos_start, pos_end, err_name, err_details):
+        super().__init__(err_details)
         self._pos_start = pos_start
         self._pos_end = pos_end
         self._err_name = err_name
         self._err_details = err_details
 
+    def __reduce__(self):
+        # Subclasses take different arguments, so unpickling rebuilds the
+        # error from its attributes instead of calling __init__ again
+        return rebuild_error, (self.__class__, self.__dict__)
+
     def as_string(self):
         string = f"{self._err_name}: {self._err_details}."
-        string += f"\nFile {self._pos_start._f_name}, line {self._pos_start._ln_num + 1}"
-        string += "\n" + string_with_arrows(self._pos_start._f_txt, self._pos_start, self._pos_end)
+        string += f"\nFile {self._pos_start.get_f_name()}, line {self._pos_start.get_ln_num() + 1}"
+        string += "\n" + string_with_arrows(self._pos_start.get_source(), self._pos_start, self._pos_end)
         return string
 
 
+def rebuild_error(error_class, state):
+    error = Exception.__new__(error_class)
+    error.__dict__.update(state)
+    return error
+
+
 class IllegalCharError(Error):
     def __init__(self, pos_start, pos_end, details):
         super().__init__(pos_start, pos_end, "Illegal Character", details)
@@ -39,7 +53,7 @@ class RTError(Error):
         pos = self._pos_start
         cntxt = self._context
         while cntxt:
-            result = f"  File {pos._f_name}, line {str(pos._ln_num + 1)}, in {cntxt._display_name}\n" + result
+            result = f"  File {pos.get_f_name()}, line {str(pos.get_ln_num() + 1)}, in {cntxt._display_name}\n" + result
             pos = cntxt._parent_entry_pos
             cntxt = cntxt._parent
 
@@ -48,5 +62,10 @@ class RTError(Error):
     def as_string(self):
         string = self.generate_traceback()
         string += f"{self._err_name}: {self._err_details}."
-        string += "\n" + string_with_arrows(self._pos_start._f_txt, self._pos_start, self._pos_end)
+        string += "\n" + string_with_arrows(self._pos_start.get_source(), self._pos_start, self._pos_end)
         return string
+
+
+class BatchError(Error):
+    def __init__(self, pos_start, pos_end, details):
+        super().__init__(pos_start, pos_end, "Batch Error", details)
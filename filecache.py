@@ -0,0 +1,283 @@
+#########################
+# FILE CACHE
+#########################
+
+"""
+An on-disk cache of parsed programs, the way CPython keeps .pyc files in
+__pycache__, so a script that did not change is not lexed and parsed again
+on every process start:
+
+    >> cache = filecache.DiskCache(filecache.default_directory("script.bas"))
+    >> basic.run_file("script.bas", disk_cache=cache)
+
+An entry holds the syntax trees of every statement of a source as columns
+of a post-order walk over their nodes, dumped with marshal:
+
+    >> VAR x = 1 + y
+
+    kind    token type   value   start  end
+    NUMBER  TT_INT       1       8      9
+    ACCESS  IDENTIFIER   'y'     12     13
+    BINARY  PLUS         None    10     11
+    ASSIGN  IDENTIFIER   'x'     4      5
+
+Kinds and token types are one byte per node, offsets are arrays of machine
+integers, so reading an entry back is a handful of C level copies. The trees
+are rebuilt from their tokens one statement at a time as the statements
+run, after loading has checked that the columns make one whole tree per
+statement, so a damaged entry is a miss and not an error in the middle of a
+run. Tokens keep only offsets into their Source (see position.py), so a
+loaded tree is tied to the text it is loaded for and errors are reported
+exactly as they are for a freshly parsed one.
+
+On a miss, basic.run_file parses and runs the statements one at a time as
+run_stream does, dumping each tree to the TreeColumns of the entry before it
+runs, and writes the entry once the last statement is parsed. A run stopped
+earlier by an error leaves the source uncached.
+
+The file name of an entry is the SHA-256 of FORMAT_VERSION, the byte order
+and the source bytes, so an edited source misses the cache and so does every
+source once FORMAT_VERSION is bumped. FORMAT_VERSION must change whenever
+the lexer or the parser would build a different tree from the same text.
+Entries are written to a temporary file renamed over the entry, so a reader
+never sees half an entry, and an entry that cannot be read back is a miss.
+Sources that fail to lex or parse are not cached.
+"""
+
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+from itertools import islice
+
+from parser import (
+    ParseResult,
+    NumberNode,
+    VariableAccessNode,
+    VariableAssignNode,
+    UnaryOpNode,
+    BinaryOpNode
+)
+from position import Source, MappedText
+from tokens import TokenObj
+
+MAGIC = b"BASC"
+FORMAT_VERSION = 1
+HEADER = MAGIC + FORMAT_VERSION.to_bytes(2, "little")
+DIRECTORY_NAME = "__basiccache__"
+SUFFIX = ".basc"
+
+NUMBER = 0
+ACCESS = 1
+ASSIGN = 2
+UNARY = 3
+BINARY = 4
+
+# Operands a node of each kind is built from
+OPERANDS_TAKEN = {NUMBER: 0, ACCESS: 0, ASSIGN: 1, UNARY: 1, BINARY: 2}
+
+
+def default_directory(path):
+    # __basiccache__ next to the script, like __pycache__
+    return os.path.join(os.path.dirname(os.path.abspath(path)), DIRECTORY_NAME)
+
+
+def source_bytes(text):
+    if isinstance(text, MappedText):
+        return text.get_buffer()
+    return text.encode("utf-8")
+
+
+class TreeColumns:
+    # The columns of the nodes of every statement, filled by dump
+    def __init__(self, offset_type):
+        self._offset_type = offset_type
+        self._counts = array("I")
+        self._kinds = bytearray()
+        self._type_indexes = bytearray()
+        self._token_types = []
+        self._type_index = {}
+        self._values = []
+        self._starts = array(offset_type)
+        self._ends = array(offset_type)
+
+    def add_node(self, kind, token):
+        type_index = self._type_index.get(token._type)
+        if type_index is None:
+            type_index = self._type_index[token._type] = len(self._token_types)
+            self._token_types.append(token._type)
+        self._kinds.append(kind)
+        self._type_indexes.append(type_index)
+        self._values.append(token._value)
+        self._starts.append(token._start)
+        self._ends.append(token._end)
+
+    def dump(self, node):
+        # Post-order over an explicit stack, trees can be deeper than the
+        # recursion limit
+        count = len(self._kinds)
+        stack = [(node, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if isinstance(node, BinaryOpNode):
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.get_right_node(), False))
+                    stack.append((node.get_left_node(), False))
+                    continue
+                kind = BINARY
+            elif isinstance(node, UnaryOpNode):
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node._node, False))
+                    continue
+                kind = UNARY
+            elif isinstance(node, VariableAssignNode):
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.get_value_node(), False))
+                    continue
+                kind = ASSIGN
+            elif isinstance(node, VariableAccessNode):
+                kind = ACCESS
+            else:
+                kind = NUMBER
+            self.add_node(kind, node.get_token())
+        self._counts.append(len(self._kinds) - count)
+
+    def as_tuple(self):
+        return (
+            self._offset_type, self._counts.tobytes(), bytes(self._kinds), bytes(self._type_indexes),
+            tuple(self._token_types), tuple(self._values), self._starts.tobytes(), self._ends.tobytes()
+        )
+
+
+def tree_columns(text):
+    # Empty columns for the trees of text
+    return TreeColumns("I" if len(text) < 1 << 32 else "Q")
+
+
+def check_trees(counts, kinds):
+    # ValueError unless the nodes of each statement make one tree
+    kinds = iter(kinds)
+    for count in counts:
+        operands = 0
+        for kind in islice(kinds, count):
+            taken = OPERANDS_TAKEN.get(kind)
+            if taken is None or operands < taken:
+                raise ValueError("columns that do not make a tree")
+            # Every node leaves one operand
+            operands += 1 - taken
+        if operands != 1:
+            raise ValueError("columns that do not make a tree")
+
+
+def load_trees(columns, source):
+    # ParseResults of the statements, each tree built when it is asked for.
+    # Raises ValueError for columns that do not make whole trees
+    offset_type, counts, kinds, type_indexes, token_types, values, starts, ends = columns
+    counts = array("I", counts)
+    starts = array(offset_type, starts)
+    ends = array(offset_type, ends)
+    if not len(kinds) == len(type_indexes) == len(values) == len(starts) == len(ends) == sum(counts):
+        raise ValueError("columns of different lengths")
+    if type_indexes and max(type_indexes) >= len(token_types):
+        raise ValueError("token type out of range")
+    check_trees(counts, kinds)
+    return build_trees(counts, zip(kinds, map(token_types.__getitem__, type_indexes), values, starts, ends), source)
+
+
+def build_trees(counts, nodes, source):
+    new_token = TokenObj.__new__
+    for count in counts:
+        operands = []
+        for _ in range(count):
+            kind, token_type, value, start, end = next(nodes)
+            token = new_token(TokenObj)
+            token._type = token_type
+            token._value = value
+            token._start = start
+            token._end = end
+            token._source = source
+            if kind == NUMBER:
+                operands.append(NumberNode(token))
+            elif kind == ACCESS:
+                operands.append(VariableAccessNode(token))
+            elif kind == ASSIGN:
+                operands[-1] = VariableAssignNode(token, operands[-1])
+            elif kind == UNARY:
+                operands[-1] = UnaryOpNode(token, operands[-1])
+            else:
+                right_node = operands.pop()
+                operands[-1] = BinaryOpNode(operands[-1], token, right_node)
+        yield ParseResult().success(operands.pop())
+
+
+class DiskCache:
+    def __init__(self, directory):
+        self._directory = directory
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+
+    def get_directory(self):
+        return self._directory
+
+    def path_of(self, text):
+        digest = hashlib.sha256(HEADER + sys.byteorder.encode("ascii"))
+        digest.update(source_bytes(text))
+        return os.path.join(self._directory, digest.hexdigest() + SUFFIX)
+
+    def load(self, f_name, text):
+        # An iterator over the ParseResults of the statements of text, None on
+        # a miss
+        try:
+            with open(self.path_of(text), "rb") as file:
+                blob = file.read()
+        except OSError:
+            self._misses += 1
+            return None
+        try:
+            if not blob.startswith(HEADER):
+                raise ValueError("not a cache entry of this format")
+            length, columns = marshal.loads(memoryview(blob)[len(HEADER):])
+            if length != len(text):
+                raise ValueError("entry of another source")
+            statements = load_trees(columns, Source(f_name, text))
+        except (ValueError, EOFError, TypeError, IndexError):
+            self._misses += 1
+            return None
+        self._hits += 1
+        return statements
+
+    def store(self, text, trees):
+        # Returns whether the entry was written, a cache that cannot be
+        # written to only makes runs slower
+        columns = tree_columns(text)
+        for tree in trees:
+            columns.dump(tree._node)
+        return self.store_columns(text, columns)
+
+    def store_columns(self, text, columns):
+        # store, with the trees dumped already
+        blob = HEADER + marshal.dumps((len(text), columns.as_tuple()))
+        path = self.path_of(text)
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(SUFFIX + ".tmp", ".", self._directory)
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(blob)
+                os.replace(temporary_path, path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        except OSError:
+            return False
+        self._writes += 1
+        return True
+
+    def stats(self):
+        return {"hits": self._hits, "misses": self._misses, "writes": self._writes}
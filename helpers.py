@@ -1,26 +1,23 @@
-def string_with_arrows(text, pos_start, pos_end):
+def string_with_arrows(source, pos_start, pos_end):
     result = ''
+    text = source.get_text()
 
-    # Calculate indices
-    idx_start = max(text.rfind('\n', 0, pos_start._indx), 0)
-    idx_end = text.find('\n', idx_start + 1)
-    if idx_end < 0: idx_end = len(text)
+    # Calculate lines, an end offset is exclusive so it belongs to the line
+    # of the character before it
+    ln_start = source.line_of(pos_start._indx)
+    ln_end = source.line_of(max(pos_end._indx - 1, pos_start._indx))
 
     # Generate each line
-    line_count = pos_end._ln_num - pos_start._ln_num + 1
+    line_count = ln_end - ln_start + 1
     for i in range(line_count):
         # Calculate line columns
-        line = text[idx_start:idx_end]
-        col_start = pos_start._col_num if i == 0 else 0
-        col_end = pos_end._col_num if i == line_count - 1 else len(line) - 1
+        ln_num = ln_start + i
+        line = text[source.line_start(ln_num):source.line_end(ln_num)]
+        col_start = pos_start._indx - source.line_start(ln_start) if i == 0 else 0
+        col_end = pos_end._indx - source.line_start(ln_end) if i == line_count - 1 else len(line) - 1
 
         # Append to result
         result += line + '\n'
         result += ' ' * col_start + '^' * (col_end - col_start)
 
-        # Re-calculate indices
-        idx_start = idx_end
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
-
     return result.replace('\t', '')
@@ -0,0 +1,219 @@
+#########################
+# INCREMENTAL
+#########################
+
+"""
+A Document keeps the tokens and syntax trees of a source that is edited
+in place, the way an editor edits its buffer, and after each edit lexes
+and parses again only the lines the edit touched:
+
+    >> document = incremental.Document("<buffer>", "VAR x = 1\\nx * 2\\n")
+    >> document.edit(8, 1, "40")        # VAR x = 40
+    (0, 1)                              # line 0 lexed and parsed again
+    >> document.get_statements()        # as parsing the whole text would give
+    >> document.get_error()             # the first error, for diagnostics
+
+Statements are separated by newlines and no token spans a newline, so
+every line is lexed and parsed on its own, over its own region of the text
+(see Lexer.iter_region). Tokens and nodes keep offsets into the whole text,
+so the tokens, nodes and errors of the lines after an edit are shifted by
+its length, in place, by the edit itself. An edit costs lexing and parsing
+the lines it touches plus moving the offsets of the lines after it.
+
+What get_tokens, get_statements and get_error return are live views of the
+document: the tokens, nodes and errors in them are the document's own, an
+edit moves their offsets along with the text, and they always agree with
+the current text (and Source) they are rendered against. A caller keeping
+the state of an older text must copy it before the edit. The exception is
+what is parsed again on each call (the statements from the first failing
+line on, the error of get_error, see below): it is not the document's and
+later edits leave it as it was.
+
+The only statement that reads past its own line is a VAR missing its name
+or '=' (the parser consumes the two tokens after VAR whatever they are),
+and it always fails. The statements of the document end at the first
+failure anyway, so the first failing line is parsed once more against the
+rest of the text and that result is the one reported.
+
+get_tokens and get_statements give exactly what exec_lexer and
+basic.parse_statements give for the whole current text.
+"""
+
+from bisect import bisect_right
+
+from basic import parse_statements
+from lexer import Lexer
+from parser import iter_nodes
+from position import Position, Source
+from tokens import TokenObj, TokenTypes
+
+
+class RegionTokens:
+    # Token stream of parse_statements over a region of the text, keeping
+    # every token it hands out so the tokens the parser did not need can be
+    # added after
+    def __init__(self, source, text, start, end):
+        self._lexer = Lexer(source.get_f_name(), text)
+        self._tokens = self._lexer.iter_region(source, start, end)
+        self._taken = []
+
+    def iter_tokens(self):
+        for token in self._tokens:
+            self._taken.append(token)
+            yield token
+
+    def get_error(self):
+        return self._lexer.get_error()
+
+    def finish(self):
+        # The tokens of the region, without the EOF ending it
+        self._taken.extend(self._tokens)
+        return self._taken[:-1]
+
+
+class Line:
+    __slots__ = ("_tokens", "_lexer_error", "_statements")
+
+    def __init__(self, tokens, lexer_error, statements):
+        self._tokens = tokens
+        self._lexer_error = lexer_error
+        # ParseResults of the line, as the statements of the whole text
+        # would give them, the last one failed if the line has an error
+        self._statements = statements
+
+    def failed(self):
+        return bool(self._statements) and self._statements[-1]._error is not None
+
+    def shift(self, delta):
+        for token in self._tokens:
+            token._start += delta
+            token._end += delta
+        for statement in self._statements:
+            if statement._node is not None:
+                shift_nodes(statement._node, delta)
+            if statement._error is not None:
+                shift_error(statement._error, delta)
+            # Positions cached by a compiled Python function are stale
+            statement._py_program = None
+        # Lexed after the parser stopped at a syntax error, not yet shifted
+        # as the error of a statement
+        errors = [statement._error for statement in self._statements]
+        if self._lexer_error is not None and not any(error is self._lexer_error for error in errors):
+            shift_error(self._lexer_error, delta)
+
+
+def shift_nodes(node, delta):
+    for node in iter_nodes(node):
+        node._start += delta
+        node._end += delta
+
+
+def shift_error(error, delta):
+    error._pos_start._indx += delta
+    if error._pos_end is not error._pos_start:
+        error._pos_end._indx += delta
+
+
+def lex_line(source, text, start, end):
+    region_tokens = RegionTokens(source, text, start, end)
+    statements = list(parse_statements(region_tokens))
+    return Line(region_tokens.finish(), region_tokens.get_error(), statements)
+
+
+class Document:
+    def __init__(self, f_name, text):
+        self._text = text
+        self._source = Source(f_name, text)
+        # Offset of the start of every line, shared with the Source so it
+        # never has to find the lines itself to render an error
+        self._line_starts = [0]
+        indx = text.find("\n")
+        while indx >= 0:
+            self._line_starts.append(indx + 1)
+            indx = text.find("\n", indx + 1)
+        self._source._line_starts = self._line_starts
+        self._lines = [self.lex_line(indx) for indx in range(len(self._line_starts))]
+
+    def get_text(self):
+        return self._text
+
+    def get_source(self):
+        return self._source
+
+    def get_line_count(self):
+        return len(self._lines)
+
+    def line_end(self, indx):
+        # End of the region of a line, after its newline
+        if indx + 1 < len(self._line_starts):
+            return self._line_starts[indx + 1]
+        return len(self._text)
+
+    def lex_line(self, indx):
+        return lex_line(self._source, self._text, self._line_starts[indx], self.line_end(indx))
+
+    def edit(self, offset, deleted, inserted):
+        # Replaces deleted characters at offset by inserted, returns the
+        # (first line, number of lines) lexed and parsed again
+        if offset < 0 or deleted < 0 or offset + deleted > len(self._text):
+            raise ValueError(f"Edit of {deleted} characters at {offset} is outside the text")
+        line_starts = self._line_starts
+        first = bisect_right(line_starts, offset) - 1
+        last = bisect_right(line_starts, offset + deleted) - 1
+        is_final = last + 1 == len(line_starts)
+        delta = len(inserted) - deleted
+        region_end = self.line_end(last) + delta
+
+        self._text = self._text[:offset] + inserted + self._text[offset + deleted:]
+        self._source._text = self._text
+
+        # Lines of the edited region. A newline ending the region starts the
+        # line after it, which only is a new line when the region was the end
+        # of the text
+        new_starts = [line_starts[first]]
+        stop = region_end if is_final else region_end - 1
+        indx = self._text.find("\n", new_starts[0], stop)
+        while indx >= 0:
+            new_starts.append(indx + 1)
+            indx = self._text.find("\n", indx + 1, stop)
+        line_starts[first:] = new_starts + [start + delta for start in line_starts[last + 1:]]
+        self._lines[first:last + 1] = [self.lex_line(indx) for indx in range(first, first + len(new_starts))]
+        if delta:
+            for indx in range(first + len(new_starts), len(self._lines)):
+                self._lines[indx].shift(delta)
+        return first, len(new_starts)
+
+    def get_tokens(self):
+        # (tokens, error) as exec_lexer gives them for the whole text
+        tokens = []
+        for line in self._lines:
+            if line._lexer_error is not None:
+                return [], line._lexer_error
+            tokens.extend(line._tokens)
+        tokens.append(TokenObj(TokenTypes.TT_EOF, start_pos=Position(len(self._text), self._source)))
+        return tokens, None
+
+    def statements_in_context(self, indx):
+        # Statements from the start of line indx up to the first failure,
+        # parsed with the rest of the text after it
+        region_tokens = RegionTokens(self._source, self._text, self._line_starts[indx], len(self._text))
+        return list(parse_statements(region_tokens))
+
+    def get_statements(self):
+        # ParseResults as basic.parse_statements gives them for the whole
+        # text, ending with the first failure
+        statements = []
+        for indx, line in enumerate(self._lines):
+            if line.failed():
+                statements.extend(self.statements_in_context(indx))
+                break
+            statements.extend(line._statements)
+        return statements
+
+    def get_error(self):
+        # The error a parse of the whole text reports, None if it has none
+        for indx, line in enumerate(self._lines):
+            if line.failed():
+                return self.statements_in_context(indx)[-1]._error
+        return None
+
@@ -0,0 +1,322 @@
+#########################
+# INSTRUMENTATION
+#########################
+
+"""
+Optional per phase measurements of basic.run and the other entry points.
+An observer passed to a Session (or to a single run) is handed a
+PhaseStats for every phase of the pipeline as it finishes:
+
+    >> recorder = instrument.Recorder()
+    >> basic.Session(observer=recorder).run("<stdin>", "VAR x = 2 ^ 10")
+    >> recorder.totals()["parse"]
+    {"calls": 1, "wall_time": 1.9e-05, "cpu_time": 1.9e-05,
+     "counts": {"nodes": 3}, "by_type": {"VariableAssignNode": 1, ...}}
+
+phase        counts                        by_type
+cache        hits (0 or 1)
+disk_cache   hits (0 or 1)
+lex          tokens
+parse        nodes, tokens when streaming  nodes of each node class
+optimize     nodes                         nodes of each node class
+compile      instructions (vm engine)
+interpreter  visits                        visits of each node class
+vm           instructions
+python
+
+Every phase has its wall time (perf_counter) and CPU time (process_time).
+With trace_allocations, the bytes a phase left allocated and the peak it
+reached over what was allocated when it started are measured with
+tracemalloc. tracemalloc traces the whole process, so the traced phases of
+all threads take turns (TRACE_LOCK), and allocations made meanwhile by
+threads that do not trace are counted too. tracemalloc is started for the
+phase and stopped after it. When the caller traces already, its tracer is
+left alone: only the bytes left allocated are measured, the peak is None.
+
+With count_objects, the Position, TokenObj and Number objects a phase
+created are counted by class, through a profile function (sys.setprofile)
+seeing their __init__ calls in the thread running the phase. It slows the
+phase down, its times included, and is skipped (None) when the thread is
+profiled already. The tokens of trees loaded from a DiskCache are built
+without __init__ and are not counted.
+
+When a run streams its statements (run_stream, run_file), tokens are lexed
+while the parser asks for them, so lexing is timed as part of each
+statement's parse phase.
+
+Without an observer, the default, every phase runs exactly as it does
+without this module, at the cost of one `is None` test, so an observer can
+be passed for a sample of the runs of a busy Session and left out of the
+others.
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+
+from interpreter import Interpreter, Number
+from parser import iter_nodes
+from position import Position
+from tokens import TokenObj
+
+# Classes whose objects count_objects counts
+COUNTED_CLASSES = (Position, TokenObj, Number)
+
+# Held over a phase tracing allocations, tracemalloc has one state per process
+TRACE_LOCK = threading.RLock()
+
+
+class PhaseStats:
+    __slots__ = (
+        "_phase", "_wall_time", "_cpu_time", "_counts", "_by_type", "_allocated_bytes", "_peak_bytes", "_created"
+    )
+
+    def __init__(self, phase, wall_time, cpu_time, counts, by_type, allocated_bytes=None, peak_bytes=None,
+                 created=None):
+        self._phase = phase
+        self._wall_time = wall_time
+        self._cpu_time = cpu_time
+        self._counts = counts
+        self._by_type = by_type
+        # None unless the observer traces allocations
+        self._allocated_bytes = allocated_bytes
+        self._peak_bytes = peak_bytes
+        # Class name -> objects created, None unless the observer counts objects
+        self._created = created
+
+    def get_phase(self):
+        return self._phase
+
+    def get_wall_time(self):
+        return self._wall_time
+
+    def get_cpu_time(self):
+        return self._cpu_time
+
+    def get_counts(self):
+        return self._counts
+
+    def get_by_type(self):
+        return self._by_type
+
+    def get_allocated_bytes(self):
+        return self._allocated_bytes
+
+    def get_peak_bytes(self):
+        return self._peak_bytes
+
+    def get_created(self):
+        return self._created
+
+    def __repr__(self):
+        return f"PhaseStats({self._phase}, wall={self._wall_time:.6f}, cpu={self._cpu_time:.6f}, {self._counts})"
+
+
+class Observer:
+    # Calls callback with the PhaseStats of every phase, subclasses override
+    # on_phase instead
+    def __init__(self, callback=None, trace_allocations=False, count_objects=False):
+        self._callback = callback
+        self._trace_allocations = trace_allocations
+        self._count_objects = count_objects
+
+    def get_trace_allocations(self):
+        return self._trace_allocations
+
+    def get_count_objects(self):
+        return self._count_objects
+
+    def on_phase(self, stats):
+        if self._callback is not None:
+            self._callback(stats)
+
+
+class Recorder(Observer):
+    # Adds up the phases by name, its size does not grow with the number of
+    # runs so it can observe a long running Session
+    def __init__(self, trace_allocations=False, count_objects=False):
+        super().__init__(trace_allocations=trace_allocations, count_objects=count_objects)
+        self._totals = {}
+
+    def on_phase(self, stats):
+        total = self._totals.get(stats._phase)
+        if total is None:
+            total = self._totals[stats._phase] = {
+                "calls": 0, "wall_time": 0.0, "cpu_time": 0.0, "counts": {}, "by_type": {}
+            }
+            if self._trace_allocations:
+                total["allocated_bytes"] = 0
+                total["peak_bytes"] = 0
+            if self._count_objects:
+                total["created"] = {}
+        total["calls"] += 1
+        total["wall_time"] += stats._wall_time
+        total["cpu_time"] += stats._cpu_time
+        for totals, amounts in ((total["counts"], stats._counts), (total["by_type"], stats._by_type)):
+            for key, amount in amounts.items():
+                totals[key] = totals.get(key, 0) + amount
+        if stats._allocated_bytes is not None:
+            total["allocated_bytes"] += stats._allocated_bytes
+        if stats._peak_bytes is not None:
+            total["peak_bytes"] = max(total["peak_bytes"], stats._peak_bytes)
+        if stats._created is not None:
+            created = total["created"]
+            for name, amount in stats._created.items():
+                created[name] = created.get(name, 0) + amount
+
+    def totals(self):
+        return self._totals
+
+    def clear(self):
+        self._totals = {}
+
+
+class CountingInterpreter(Interpreter):
+    # Counts the nodes it visits by class
+    def __init__(self):
+        super().__init__()
+        self._visits = {}
+
+    def interpret(self, node, context):
+        name = type(node).__name__
+        self._visits[name] = self._visits.get(name, 0) + 1
+        return super().interpret(node, context)
+
+
+class CreationCounter:
+    # Profile function counting the __init__ calls of COUNTED_CLASSES
+    def __init__(self):
+        self._names = {cls.__init__.__code__: cls.__name__ for cls in COUNTED_CLASSES}
+        self._created = dict.fromkeys(self._names.values(), 0)
+
+    def __call__(self, frame, event, argument):
+        if event == "call":
+            name = self._names.get(frame.f_code)
+            if name is not None:
+                self._created[name] += 1
+
+    def get_created(self):
+        return self._created
+
+
+class CountingIterator:
+    # Counts the items taken from an iterator, for the tokens of a stream
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._count = 0
+        self._reported = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self._count += 1
+        return item
+
+    def take_count(self):
+        # Items taken since the last call
+        count = self._count - self._reported
+        self._reported = self._count
+        return count
+
+
+def nodes_by_type(node):
+    by_type = {}
+    for node in iter_nodes(node):
+        name = type(node).__name__
+        by_type[name] = by_type.get(name, 0) + 1
+    return by_type
+
+
+# Counters turn the result and arguments of a phase into its
+# (counts, by_type)
+
+def count_cache(entry, key):
+    return {"hits": int(entry is not None)}, {}
+
+
+def count_disk_cache(statements, f_name, text):
+    return {"hits": int(statements is not None)}, {}
+
+
+def count_tokens(result, f_name, text):
+    tokens, error = result
+    return {"tokens": len(tokens)}, {}
+
+
+def count_nodes(ast, *arguments):
+    if ast is None or ast._node is None:
+        return {"nodes": 0}, {}
+    by_type = nodes_by_type(ast._node)
+    return {"nodes": sum(by_type.values())}, by_type
+
+
+def count_instructions(code, *arguments):
+    return {"instructions": len(code.get_instructions()) // 2}, {}
+
+
+def count_executed(result, code, *arguments):
+    return count_instructions(code)
+
+
+def count_visits(result, ast, context, interpreter, *arguments):
+    return {"visits": sum(interpreter._visits.values())}, interpreter._visits
+
+
+def count_nothing(result, *arguments):
+    return {}, {}
+
+
+def stream_counter(tokens):
+    # Counter of a streamed parse phase, which also lexed the tokens it read
+    def count(ast, *arguments):
+        counts, by_type = count_nodes(ast)
+        counts["tokens"] = tokens.take_count()
+        return counts, by_type
+    return count
+
+
+def run_phase(observer, phase, counter, function, *arguments):
+    # Returns function(*arguments), reporting the phase to the observer
+    if observer is None:
+        return function(*arguments)
+
+    tracing = observer.get_trace_allocations()
+    started_tracing = False
+    if tracing:
+        TRACE_LOCK.acquire()
+        # Tracing already, by the caller, whose peak must not be reset
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        allocated_before = tracemalloc.get_traced_memory()[0]
+    counter_of_objects = None
+    if observer.get_count_objects() and sys.getprofile() is None:
+        counter_of_objects = CreationCounter()
+        sys.setprofile(counter_of_objects)
+    try:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = function(*arguments)
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - wall_start
+        allocated_bytes = peak_bytes = None
+        if tracing:
+            allocated, peak = tracemalloc.get_traced_memory()
+            allocated_bytes = allocated - allocated_before
+            if started_tracing:
+                peak_bytes = peak - allocated_before
+    finally:
+        if counter_of_objects is not None:
+            sys.setprofile(None)
+        if tracing:
+            if started_tracing:
+                tracemalloc.stop()
+            TRACE_LOCK.release()
+
+    counts, by_type = counter(result, *arguments)
+    created = None if counter_of_objects is None else counter_of_objects.get_created()
+    observer.on_phase(PhaseStats(phase, wall_time, cpu_time, counts, by_type, allocated_bytes, peak_bytes, created))
+    return result
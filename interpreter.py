@@ -1,4 +1,7 @@
+from compiler import value_positions
 from errors import RTError
+from limits import LimitExceeded
+from resolver import exec_resolver, load_frame
 from tokens import TokenTypes
 
 
@@ -11,6 +14,8 @@ class Context:
 
 
 class Number:
+    __slots__ = ("_value", "_start_pos", "_end_pos", "_context")
+
     def __init__(self, value):
         self._value = value
         self._start_pos = None
@@ -65,14 +70,15 @@ class Number:
 
 
 class SymbolTable:
-    def __init__(self):
+    def __init__(self, parent=None):
         self._symbols = {}
-        self._parent = None
+        # Looked up on a miss, never written to
+        self._parent = parent
 
     def get(self, variable_name):
         value = self._symbols.get(variable_name, None)
         if value is None and self._parent:
-            return self._parent.get(variable_name, None)
+            return self._parent.get(variable_name)
         return value
 
     def set(self, variable_name, value):
@@ -81,95 +87,101 @@ class SymbolTable:
     def remove(self, variable_name):
         del self._symbols[variable_name]
 
-
-class RuntimeResult:
-    def __init__(self):
-        self._value = None
-        self._error = None
-
-    def register(self, res):
-        if res._error:
-            self._error = res._error
-        return res._value
-
-    def success(self, value):
-        self._value = value
-        return self
-
-    def failed(self, error):
-        self._error = error
-        return self
+    def defines(self, variable_name):
+        # Whether this table holds the variable, its parents are not looked at
+        return variable_name in self._symbols
 
 
 class Interpreter:
+    # Visit methods return plain int / float values and raise the Error on
+    # failure. A Number with its position and context is only built where a
+    # value leaves the interpreter: stored variables, the final result and
+    # runtime errors, which carry the positions the boxed Number would have had.
+    # Variables live in a frame indexed by the slots the resolver assigned
+
+    def __init__(self):
+        self._frame = None
+        # Last VariableAssignNode of each slot, None while it is not assigned
+        self._assigned = None
+        # Value of each CachedNode evaluated so far, by index
+        self._cached = None
+        # Budget of the run (see limits.py), None for no limits
+        self._budget = None
 
     def no_visit_method(self, node, context):
         raise Exception(f"No visit_{type(node).__name__} method defined")
 
     def visit_NumberNode(self, node, context):
-        token = node.get_token()
-        return RuntimeResult().success(
-            Number(token.get_value()).set_context(context).set_position(node.get_start_pos(), node.get_end_pos())
-        )
+        return node.get_token().get_value()
 
     def visit_VariableAssignNode(self, node, context):
-        res = RuntimeResult()
-        var_name = node.get_token().get_value()
-        value = res.register(self.interpret(node.get_value_node(), context))
-        if res._error:
-            return res
-        context._symbol_table.set(var_name, value)
-        return res.success(value)
+        value = self.interpret(node.get_value_node(), context)
+        self._frame[node._slot] = value
+        self._assigned[node._slot] = node
+        return value
 
     def visit_VariableAccessNode(self, node, context):
-        res = RuntimeResult()
-        var_name = node.get_token().get_value()
-        value = context._symbol_table.get(var_name)
-        if not value:
-            return res.failed(RTError(node.get_start_pos(), node.get_end_pos(),
-                                      f"'{var_name}' is not defined.", context))
-        value = value.copy().set_position(node.get_start_pos(), node.get_end_pos())
-        return res.success(value)
+        value = self._frame[node._slot]
+        if value is None:
+            var_name = node.get_token().get_value()
+            raise RTError(node.get_start_pos(), node.get_end_pos(), f"'{var_name}' is not defined.", context)
+        return value
 
     def visit_UnaryOpNode(self, node, context):
-        res = RuntimeResult()
-        number = res.register(self.interpret(node._node, context))
-        if res._error:
-            return res
-        token = node.get_token()
-        error = None
-        if token.get_type() == TokenTypes.TT_MINUS:
-            number, error = number.mul_by(Number(-1))
-        if error:
-            return res.failed(error)
-        else:
-            return res.success(number.set_position(node.get_start_pos(), node.get_end_pos()))
+        value = self.interpret(node._node, context)
+        if node.get_token().get_type() == TokenTypes.TT_MINUS:
+            return -value
+        return value
+
+    def visit_CachedNode(self, node, context):
+        value = self._cached[node._index] = self.interpret(node._node, context)
+        return value
+
+    def visit_ReusedNode(self, node, context):
+        return self._cached[node._cached._index]
 
     def visit_BinaryOpNode(self, node, context):
-        res = RuntimeResult()
-        left = res.register(self.interpret(node.get_left_node(), context))
-        if res._error:
-            return res
-        right = res.register(self.interpret(node.get_right_node(), context))
-        if res._error:
-            return res
-
-        token = node.get_token()
-        if token.get_type() == TokenTypes.TT_PLUS:
-            result, error = left.added_to(right)
-        elif token.get_type() == TokenTypes.TT_MINUS:
-            result, error = left.sub_by(right)
-        elif token.get_type() == TokenTypes.TT_MUL:
-            result, error = left.mul_by(right)
-        elif token.get_type() == TokenTypes.TT_DIV:
-            result, error = left.div_by(right)
-        elif token.get_type() == TokenTypes.TT_POWER:
-            result, error = left.pow_by(right)
-
-        if error:
-            return res.failed(error)
-        else:
-            return res.success(result.set_position(node.get_start_pos(), node.get_end_pos()))
+        left = self.interpret(node.get_left_node(), context)
+        right = self.interpret(node.get_right_node(), context)
+
+        token_type = node.get_token().get_type()
+        if token_type == TokenTypes.TT_PLUS:
+            return left + right
+        elif token_type == TokenTypes.TT_MINUS:
+            return left - right
+        elif token_type == TokenTypes.TT_MUL:
+            if self._budget is not None:
+                return self.limited(self._budget.multiply, left, right, node, context)
+            return left * right
+        elif token_type == TokenTypes.TT_DIV:
+            if right == 0:
+                # Reported at the divisor, as Number.div_by does
+                start_pos, end_pos = value_positions(node.get_right_node())
+                raise RTError(start_pos, end_pos, "Division by Zero", context)
+            return left / right
+        elif token_type == TokenTypes.TT_POWER:
+            if self._budget is not None:
+                return self.limited(self._budget.power, left, right, node, context)
+            return left ** right
+
+    def limited(self, operation, left, right, node, context):
+        try:
+            return operation(left, right)
+        except LimitExceeded as error:
+            raise RTError(node.get_start_pos(), node.get_end_pos(), error.get_details(), context)
+
+    def load_frame(self, names, context):
+        self._frame = load_frame(names, context._symbol_table)
+        self._assigned = [None] * len(names)
+        self._cached = {}
+
+    def store_frame(self, names, context):
+        # Assigned slots go back to the symbol table, as boxed Numbers
+        for slot, node in enumerate(self._assigned):
+            if node is not None:
+                start_pos, end_pos = value_positions(node)
+                number = Number(self._frame[slot]).set_context(context).set_position(start_pos, end_pos)
+                context._symbol_table.set(names[slot], number)
 
     def interpret(self, node, context):
         method_name = f"visit_{type(node).__name__}"
@@ -177,13 +189,59 @@ class Interpreter:
         return method(node, context)
 
 
-GLOBAL_SYMBOL_TABLE = SymbolTable()
-GLOBAL_SYMBOL_TABLE.set("null", Number(0))
+def make_builtins():
+    symbol_table = SymbolTable()
+    symbol_table.set("null", Number(0))
+    return symbol_table
+
+
+# Names every program starts with, shared read-only by all global symbol
+# tables. Assigning to a builtin shadows it in the assigning table only,
+# the copy on write leaves BUILTINS and every other table unchanged
+BUILTINS = make_builtins()
+
+
+def make_global_symbol_table():
+    return SymbolTable(BUILTINS)
+
+
+GLOBAL_SYMBOL_TABLE = make_global_symbol_table()
 
 
-def exec_interpreter(abstract_syntax_tree):
-    interpreter = Interpreter()
+def make_program_context(symbol_table=None):
     context = Context('<program>')
-    context._symbol_table = GLOBAL_SYMBOL_TABLE
-    result = interpreter.interpret(abstract_syntax_tree._node, context)
-    return result._value, result._error
+    context._symbol_table = GLOBAL_SYMBOL_TABLE if symbol_table is None else symbol_table
+    return context
+
+
+def exec_interpreter(abstract_syntax_tree, context=None, interpreter=None, budget=None):
+    if interpreter is None:
+        interpreter = Interpreter()
+    if context is None:
+        context = make_program_context()
+    if abstract_syntax_tree._slot_names is None:
+        exec_resolver(abstract_syntax_tree)
+    names = abstract_syntax_tree._slot_names
+    node = abstract_syntax_tree._node
+    if budget is not None:
+        try:
+            budget.spend(abstract_syntax_tree._node_count)
+        except LimitExceeded as error:
+            start_pos, end_pos = value_positions(node)
+            return None, RTError(start_pos, end_pos, error.get_details(), context)
+        interpreter._budget = budget
+    interpreter.load_frame(names, context)
+    try:
+        value = interpreter.interpret(node, context)
+    except RTError as error:
+        return None, error
+    except RecursionError:
+        # The parser accepts any nesting depth, the tree-walker does not;
+        # the VM engine runs such trees without recursion
+        return None, RTError(node.get_start_pos(), node.get_end_pos(), "Expression is nested too deeply", context)
+    finally:
+        # Assignments made before an error are kept, as they were when every
+        # assignment went straight to the symbol table
+        interpreter.store_frame(names, context)
+    start_pos, end_pos = value_positions(node)
+    return Number(value).set_context(context).set_position(start_pos, end_pos), None
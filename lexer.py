@@ -2,102 +2,151 @@
 # LEXER
 #########################
 
+"""
+The lexer is driven by a single compiled master regex instead of reading
+one character at a time. Each alternative of the pattern is one kind of
+lexeme, and the index of the group that matched tells which one:
+
+    >> VAR x = 12.5 * y
+
+    VAR      -> IDENTIFIER group, found in KEYWORDS -> KEYWORD
+    ' x'     -> IDENTIFIER group, the leading blank is skipped
+    ' 12.5'  -> NUMBER group -> FLOAT
+    *        -> OPERATOR group -> MUL
+
+A newline separates statements and becomes a NEWLINE token. Tokens are
+produced lazily by iter_tokens, so a parser can consume them while the
+rest of the input has not been scanned yet.
+
+Tokens only record start / end offsets and a reference to their Source,
+line and column numbers are derived from the offsets when an error is
+rendered (see position.py).
+
+The last alternative matches any other single character, so every
+character of the input is covered by exactly one match and an illegal
+character is reported exactly where it is found.
+"""
+
+import re
 
 from errors import (
     IllegalCharError
 )
-from position import Position
+from position import Position, Source, MappedText
 from tokens import (
     DIGITS,
     LETTERS,
-    ALPHANUMERIC,
     KEYWORDS,
     UNDERSCORE_ALPHANUMERIC,
     TokenTypes,
     TokenObj
 )
 
+FLOAT_GROUP = 1
+INT_GROUP = 2
+IDENTIFIER_GROUP = 3
+OPERATOR_GROUP = 4
+NEWLINE_GROUP = 5
+ILLEGAL_GROUP = 6
+
+# Leading blanks are swallowed by every match, and the lexeme groups are
+# optional so trailing blanks give one last match with no group at all
+MASTER_SOURCE = (
+    rf"[ \t]*(?:"
+    rf"([{DIGITS}]+\.[{DIGITS}]*)"
+    rf"|([{DIGITS}]+)"
+    rf"|([{LETTERS}][{UNDERSCORE_ALPHANUMERIC}]*)"
+    rf"|([-+*/^=()])"
+    rf"|(\n)"
+    rf"|(.)"
+    rf")?"
+)
+MASTER_PATTERN = re.compile(MASTER_SOURCE, re.DOTALL)
+# Same pattern for sources scanned straight from a bytes buffer (see MappedText)
+BYTES_MASTER_PATTERN = re.compile(MASTER_SOURCE.encode("ascii"), re.DOTALL)
+
+OPERATOR_TYPES = {
+    "+": TokenTypes.TT_PLUS,
+    "-": TokenTypes.TT_MINUS,
+    "*": TokenTypes.TT_MUL,
+    "/": TokenTypes.TT_DIV,
+    "^": TokenTypes.TT_POWER,
+    "=": TokenTypes.TT_EQ,
+    "(": TokenTypes.TT_LPAREN,
+    ")": TokenTypes.TT_RPAREN,
+}
+OPERATOR_TYPES.update({lexeme.encode("ascii"): t_type for lexeme, t_type in list(OPERATOR_TYPES.items())})
+
+KEYWORD_SET = frozenset(KEYWORDS)
+
 
 class Lexer:
     def __init__(self, f_name: str, text: str):
         self._f_name = f_name
         self._text = text
-        self.pos: Position = Position(-1, 0, -1, f_name, text)
-        self.current_char: None = None
-        self.advance()
-
-    def advance(self) -> None:
-        self.pos.advance(self.current_char)
-        self.current_char = self._text[self.pos._indx] if self.pos._indx < len(self._text) else None
-
-    def make_number(self) -> TokenObj:
-        num_str = ""
-        dot_count = 0
-        start_pos = self.pos.copy()
-        while self.current_char is not None and self.current_char in DIGITS + ".":
-            if self.current_char == ".":
-                if dot_count == 1:
-                    break
-                dot_count += 1
-                num_str += "."
-            else:
-                num_str += self.current_char
-            self.advance()
-        if dot_count == 0:
-            return TokenObj(TokenTypes.TT_INT, int(num_str), start_pos=start_pos, end_pos=self.pos)
+        self._error = None
+
+    def get_error(self):
+        return self._error
+
+    def iter_tokens(self):
+        # Tokens are yielded one at a time, ending with EOF. On an illegal
+        # character the error is kept in self._error and an EOF token takes
+        # its place, so a parser reading the stream always terminates
+        return self.iter_region(Source(self._f_name, self._text), 0, len(self._text))
+
+    def iter_region(self, source, start, end):
+        # Tokens of text[start:end] with offsets into the whole text, ending
+        # with EOF at end. No token spans a newline, so a region ending after
+        # a newline lexes exactly as it does inside the whole text
+        text = self._text
+
+        # A MappedText is scanned in place, lexemes are bytes and only
+        # identifiers need decoding (int() and float() accept bytes)
+        is_mapped = isinstance(text, MappedText)
+        if is_mapped:
+            matches = BYTES_MASTER_PATTERN.finditer(text.get_buffer(), start, end)
         else:
-            return TokenObj(TokenTypes.TT_FLOAT, float(num_str), start_pos=start_pos, end_pos=self.pos)
+            matches = MASTER_PATTERN.finditer(text, start, end)
 
-    def make_identifier(self):
-        iden_str = ""
-        start_pos = self.pos.copy()
+        for match in matches:
+            group = match.lastindex
+            if group is None:
+                continue
+            lexeme = match[group]
+            if group == OPERATOR_GROUP:
+                token = TokenObj(OPERATOR_TYPES[lexeme])
+            elif group == INT_GROUP:
+                token = TokenObj(TokenTypes.TT_INT, int(lexeme))
+            elif group == FLOAT_GROUP:
+                token = TokenObj(TokenTypes.TT_FLOAT, float(lexeme))
+            elif group == IDENTIFIER_GROUP:
+                if is_mapped:
+                    lexeme = lexeme.decode("ascii")
+                token_type = TokenTypes.TT_KEYWORD if lexeme in KEYWORD_SET else TokenTypes.TT_IDENTIFIER
+                token = TokenObj(token_type, lexeme)
+            elif group == NEWLINE_GROUP:
+                token = TokenObj(TokenTypes.TT_NEWLINE)
+            else:
+                if is_mapped:
+                    lexeme = text.char_at(match.start(group))
+                pos_start = Position(match.start(group), source)
+                self._error = IllegalCharError(pos_start, pos_start.copy().advance(), "'" + lexeme + "'")
+                token = TokenObj(TokenTypes.TT_EOF, start_pos=pos_start)
+                yield token
+                return
+            # Only offsets are stored, no line or column bookkeeping
+            token._start = match.start(group)
+            token._end = match.end()
+            token._source = source
+            yield token
 
-        while self.current_char is not None and self.current_char in UNDERSCORE_ALPHANUMERIC:
-            iden_str += self.current_char
-            self.advance()
-        token_type = TokenTypes.TT_KEYWORD if iden_str in KEYWORDS else TokenTypes.TT_IDENTIFIER
-        return TokenObj(token_type, iden_str, start_pos=start_pos, end_pos=self.pos)
+        yield TokenObj(TokenTypes.TT_EOF, start_pos=Position(end, source))
 
     def make_tokens(self):
-        tokens = []
-
-        while self.current_char is not None:
-            if self.current_char in " \t":
-                self.advance()
-            elif self.current_char in DIGITS:
-                tokens.append(self.make_number())
-            elif self.current_char in LETTERS:
-                tokens.append(self.make_identifier())
-            elif self.current_char == "+":
-                tokens.append(TokenObj(TokenTypes.TT_PLUS, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "-":
-                tokens.append(TokenObj(TokenTypes.TT_MINUS, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "*":
-                tokens.append(TokenObj(TokenTypes.TT_MUL, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "/":
-                tokens.append(TokenObj(TokenTypes.TT_DIV, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "^":
-                tokens.append(TokenObj(TokenTypes.TT_POWER, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "=":
-                tokens.append(TokenObj(TokenTypes.TT_EQ, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == "(":
-                tokens.append(TokenObj(TokenTypes.TT_LPAREN, start_pos=self.pos))
-                self.advance()
-            elif self.current_char == ")":
-                tokens.append(TokenObj(TokenTypes.TT_RPAREN, start_pos=self.pos))
-                self.advance()
-            else:
-                pos_start = self.pos.copy()
-                char = self.current_char
-                self.advance()
-                return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
-        tokens.append(TokenObj(TokenTypes.TT_EOF, start_pos=self.pos))
+        tokens = list(self.iter_tokens())
+        if self._error:
+            return [], self._error
         return tokens, None
 
 
@@ -0,0 +1,146 @@
+#########################
+# LIMITS
+#########################
+
+"""
+Limits on the work one run may do, so programs from untrusted sources
+cannot pin a shared worker:
+
+    >> session = basic.Session(limits=limits.Limits(max_steps=100000, timeout=0.5, max_int_bits=65536))
+    >> session.run("<request>", "9 ^ 9 ^ 9")
+    (None, RTError "Integer limit of 65536 bits exceeded")
+
+limit          checked
+max_steps      before each statement runs
+timeout        before each statement runs and at every * and ^
+max_int_bits   before and after every * and ^ of two ints
+
+Steps are node visits. The language has no loops or calls, so a statement
+visits each node of its tree once and its steps are known before it runs
+(see resolver.py), it is charged for all of them and does not start when
+they are over the budget. The timeout is wall-clock seconds. * and ^ are the
+only operations whose cost grows with their operands: the size of the
+result is estimated from the sizes of the operands before they run (a
+^ b has about b * log2(|a|) bits) and a result that is surely too large is
+never computed. The exact size is checked after, so the largest integer a
+run computes is a few bits over max_int_bits. + and - grow an integer by
+one bit at most.
+
+The timeout is only checked between operations, so it cannot stop one that
+has started. What bounds the time of one * or ^ is max_int_bits: Limits
+with a max_steps or a timeout but no max_int_bits use
+DEFAULT_MAX_INT_BITS, whose largest * or ^ takes well under a tenth of a
+second. Without any limit nothing is bounded. A float * or ^ out of the
+range of floats (2.0 ^ 2000) is a RTError too.
+
+A Budget is what is left of the Limits over one call of a Session (see
+basic.py), the statements of run_stream and run_file spend from the same
+one. Going over it is a RTError at the node that would have gone over,
+the whole statement for steps. Integers folded by the optimizer are not
+checked, it never folds a power over optimizer.MAX_FOLDED_POWER_BITS.
+"""
+
+import math
+import time
+
+
+class LimitExceeded(Exception):
+    # Raised by a Budget, the engines turn it into a RTError at the node
+    # being evaluated
+    def __init__(self, details):
+        super().__init__(details)
+        self._details = details
+
+    def get_details(self):
+        return self._details
+
+
+# Integer limit of Limits with other limits but none on integers
+DEFAULT_MAX_INT_BITS = 1 << 20
+
+
+class Limits:
+    # None for no limit
+    def __init__(self, max_steps=None, timeout=None, max_int_bits=None):
+        self._max_steps = max_steps
+        self._timeout = timeout
+        if max_int_bits is None and (max_steps is not None or timeout is not None):
+            max_int_bits = DEFAULT_MAX_INT_BITS
+        self._max_int_bits = max_int_bits
+
+    def get_max_steps(self):
+        return self._max_steps
+
+    def get_timeout(self):
+        return self._timeout
+
+    def get_max_int_bits(self):
+        return self._max_int_bits
+
+    def start(self):
+        return Budget(self)
+
+
+def power_bits(left, right):
+    # Estimated bit length of left ** right, 0 when it cannot grow
+    if type(left) is not int or type(right) is not int or right <= 0 or -1 <= left <= 1:
+        return 0
+    if right.bit_length() > 1000:
+        # Too large for a float, and for any limit
+        return math.inf
+    return right * math.log2(abs(left))
+
+
+class Budget:
+    __slots__ = ("_limits", "_steps_left", "_deadline")
+
+    def __init__(self, limits):
+        self._limits = limits
+        self._steps_left = limits._max_steps
+        self._deadline = None if limits._timeout is None else time.perf_counter() + limits._timeout
+
+    def get_steps_left(self):
+        return self._steps_left
+
+    def check_time(self):
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise LimitExceeded(f"Time limit of {self._limits._timeout}s exceeded")
+
+    def check_bits(self, bits):
+        max_int_bits = self._limits._max_int_bits
+        if max_int_bits is not None and bits > max_int_bits:
+            raise LimitExceeded(f"Integer limit of {max_int_bits} bits exceeded")
+
+    def spend(self, steps):
+        # Before a statement visiting steps nodes
+        self.check_time()
+        if self._steps_left is not None:
+            if steps > self._steps_left:
+                raise LimitExceeded(f"Step limit of {self._limits._max_steps} exceeded")
+            self._steps_left -= steps
+
+    def multiply(self, left, right):
+        self.check_time()
+        if type(left) is int and type(right) is int:
+            # A product of nonzero ints has at least this many bits
+            self.check_bits(left.bit_length() + right.bit_length() - 1)
+            value = left * right
+            self.check_bits(value.bit_length())
+            return value
+        try:
+            return left * right
+        except OverflowError:
+            # An int too large for a float
+            raise LimitExceeded("Result out of the range of floats")
+
+    def power(self, left, right):
+        self.check_time()
+        # One bit of slack for the rounding of the estimate
+        self.check_bits(power_bits(left, right) - 1)
+        try:
+            value = left ** right
+        except OverflowError:
+            raise LimitExceeded("Result out of the range of floats")
+        if type(value) is int:
+            self.check_bits(value.bit_length())
+        return value
@@ -1,4 +1,16 @@
+import sys
+
 import basic
+import filecache
+
+if len(sys.argv) > 1:
+    disk_cache = filecache.DiskCache(filecache.default_directory(sys.argv[1]))
+    result, error = basic.run_file(sys.argv[1], disk_cache=disk_cache)
+    if error:
+        print(error.as_string())
+        sys.exit(1)
+    sys.exit(0)
+
 print("Ready")
 while True:
     text = input(">> ")
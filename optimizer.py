@@ -0,0 +1,321 @@
+#########################
+# OPTIMIZER
+#########################
+
+"""
+The optimizer rewrites the syntax tree between the parser and the
+interpreter / compiler so less work is left for run time.
+
+    Constant folding
+        >> VAR x = (2 ^ 10) * 3 + y
+        becomes
+        >> VAR x = 3072 + y
+
+    Algebraic simplification
+        >> y * 1, 1 * y, y + 0, 0 + y, y - 0, --y, +y
+        all become
+        >> y
+
+A folded node gets a synthetic token carrying the positions of the subtree
+it replaces, so errors still point at the same place in the source.
+Anything that would fail when evaluated (division by zero, a power with a
+negative base and fractional exponent, ...) is left in the tree so the
+error is raised at run time exactly as before.
+
+Simplifications are skipped where the span of the node is reported: a
+divisor (division by zero is reported at the divisor's own positions), the
+root (the positions of the result) and the value of an assignment (the
+positions of the stored variable). Replacing `x * 1` by `x` there would
+move them, elsewhere `x * 1` becomes `x`.
+Note that `y + 0` and `0 + y` turn a -0.0 into 0.0 when evaluated, so
+stripping them changes the sign of a negative zero float.
+
+    Common subexpressions
+        >> (a * b + c) / (a * b + c - 1) + (VAR a = 2) * b + a * b
+        a * b + c is evaluated once, its second occurrence reads the value of
+        the first. The last a * b is evaluated again, a changed in between
+
+Once folded, the subtrees are hash-consed into value numbers (see
+value_numbers): nodes with the same operator and operand numbers get the
+same number, and a variable read is numbered by its name and by how many
+assignments to that name were evaluated before it, so equal numbers always
+evaluate to equal values within a run. The first occurrence of a repeated
+number, in evaluation order, is wrapped in a CachedNode that keeps its
+value, and each later occurrence is replaced by a ReusedNode pointing at
+it, so the repeated subtree is held and evaluated once. A ReusedNode keeps
+the span of the occurrence it replaces. The first occurrence is always
+evaluated first, so an error is raised there, and a repeated divisor that
+is 0 is still reported at its own occurrence.
+"""
+
+from parser import (
+    ParseResult,
+    NumberNode,
+    UnaryOpNode,
+    BinaryOpNode,
+    VariableAccessNode,
+    VariableAssignNode,
+    CachedNode,
+    ReusedNode
+)
+from tokens import TokenTypes, TokenObj
+
+# Folding 9 ^ 9 ^ 9 would take as long as evaluating it, leave huge powers for run time
+MAX_FOLDED_POWER_BITS = 4096
+
+
+def constant_value(node):
+    if isinstance(node, NumberNode):
+        return node.get_token().get_value()
+    return None
+
+
+def is_constant(node, value):
+    # Only an int identity is a no-op for both int and float operands, 1.0 * 2 is 2.0
+    node_value = constant_value(node)
+    return type(node_value) is int and node_value == value
+
+
+def make_number_node(value, node):
+    token_type = TokenTypes.TT_INT if type(value) is int else TokenTypes.TT_FLOAT
+    return NumberNode(TokenObj(token_type, value, start_pos=node.get_start_pos(), end_pos=node.get_end_pos()))
+
+
+def keep_position(new_node, node):
+    # Rebuilt nodes keep the span of the node they replace, even when a child got shorter
+    new_node._start = node._start
+    new_node._end = node._end
+    return new_node
+
+
+def fold(op_type, left, right):
+    if op_type == TokenTypes.TT_PLUS:
+        return left + right
+    if op_type == TokenTypes.TT_MINUS:
+        return left - right
+    if op_type == TokenTypes.TT_MUL:
+        return left * right
+    if op_type == TokenTypes.TT_DIV:
+        if right == 0:
+            return None
+        return left / right
+    if op_type == TokenTypes.TT_POWER:
+        if type(left) is int and type(right) is int and right * max(left.bit_length(), 1) > MAX_FOLDED_POWER_BITS:
+            return None
+        try:
+            value = left ** right
+        except (ArithmeticError, ValueError):
+            return None
+        return value if type(value) in (int, float) else None
+    return None
+
+
+class Optimizer:
+
+    def no_visit_method(self, node, spanned):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    def visit_NumberNode(self, node, spanned):
+        return node
+
+    def visit_VariableAccessNode(self, node, spanned):
+        return node
+
+    def visit_VariableAssignNode(self, node, spanned):
+        value_node = self.optimize(node.get_value_node(), True)
+        if value_node is node.get_value_node():
+            return node
+        return keep_position(VariableAssignNode(node.get_token(), value_node), node)
+
+    def visit_UnaryOpNode(self, node, spanned):
+        child = self.optimize(node._node)
+        is_minus = node.get_token().get_type() == TokenTypes.TT_MINUS
+
+        value = constant_value(child)
+        if value is not None:
+            return make_number_node(value * -1 if is_minus else value, node)
+
+        if not spanned:
+            if not is_minus:
+                return child
+            if isinstance(child, UnaryOpNode) and child.get_token().get_type() == TokenTypes.TT_MINUS:
+                return child._node
+
+        if child is node._node:
+            return node
+        return keep_position(UnaryOpNode(node.get_token(), child), node)
+
+    def visit_BinaryOpNode(self, node, spanned):
+        op_type = node.get_token().get_type()
+        left = self.optimize(node.get_left_node())
+        right = self.optimize(node.get_right_node(), op_type == TokenTypes.TT_DIV)
+
+        left_value = constant_value(left)
+        right_value = constant_value(right)
+        if left_value is not None and right_value is not None:
+            value = fold(op_type, left_value, right_value)
+            if value is not None:
+                return make_number_node(value, node)
+
+        if not spanned:
+            if op_type == TokenTypes.TT_MUL:
+                if is_constant(right, 1):
+                    return left
+                if is_constant(left, 1):
+                    return right
+            elif op_type == TokenTypes.TT_PLUS:
+                if is_constant(right, 0):
+                    return left
+                if is_constant(left, 0):
+                    return right
+            elif op_type == TokenTypes.TT_MINUS:
+                if is_constant(right, 0):
+                    return left
+
+        if left is node.get_left_node() and right is node.get_right_node():
+            return node
+        return keep_position(BinaryOpNode(left, node.get_token(), right), node)
+
+    def optimize(self, node, spanned=False):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node, spanned)
+
+
+def value_numbers(node):
+    # Number of every pure node of the tree, None for assignments and the
+    # nodes around them. Post-order walk over an explicit stack, keys are
+    # built from the numbers of the children so they hash in constant time
+    numbers = {}
+    table = {}
+    assignments = {}
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if isinstance(node, BinaryOpNode):
+            if not children_done:
+                stack.append((node, True))
+                stack.append((node.get_right_node(), False))
+                stack.append((node.get_left_node(), False))
+                continue
+            left = numbers[node.get_left_node()]
+            right = numbers[node.get_right_node()]
+            key = None if left is None or right is None else (BinaryOpNode, node.get_token().get_type(), left, right)
+        elif isinstance(node, UnaryOpNode):
+            if not children_done:
+                stack.append((node, True))
+                stack.append((node._node, False))
+                continue
+            child = numbers[node._node]
+            key = None if child is None else (UnaryOpNode, node.get_token().get_type(), child)
+        elif isinstance(node, VariableAssignNode):
+            if not children_done:
+                stack.append((node, True))
+                stack.append((node.get_value_node(), False))
+                continue
+            name = node.get_token().get_value()
+            assignments[name] = assignments.get(name, 0) + 1
+            key = None
+        elif isinstance(node, VariableAccessNode):
+            name = node.get_token().get_value()
+            key = (VariableAccessNode, name, assignments.get(name, 0))
+        else:
+            # repr() keeps 0.0 / -0.0 and 1 / 1.0 apart, as in Compiler.constant_index
+            value = node.get_token().get_value()
+            key = (NumberNode, type(value), repr(value))
+        numbers[node] = None if key is None else table.setdefault(key, len(table))
+    return numbers
+
+
+def is_shareable(node, numbers):
+    # Reading a kept value instead of a leaf or -leaf saves nothing
+    if numbers[node] is None:
+        return False
+    if isinstance(node, UnaryOpNode):
+        return isinstance(node._node, (BinaryOpNode, UnaryOpNode))
+    return isinstance(node, BinaryOpNode)
+
+
+def find_repeats(node, numbers):
+    # (nodes replaced by a ReusedNode, numbers whose first occurrence is
+    # cached). A repeat is not looked into, repeats inside it are gone with it
+    reused = set()
+    cached = set()
+    evaluated = set()
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            if is_shareable(node, numbers):
+                evaluated.add(numbers[node])
+            continue
+        if numbers[node] in evaluated and is_shareable(node, numbers):
+            reused.add(node)
+            cached.add(numbers[node])
+            continue
+        stack.append((node, True))
+        if isinstance(node, BinaryOpNode):
+            stack.append((node.get_right_node(), False))
+            stack.append((node.get_left_node(), False))
+        elif isinstance(node, UnaryOpNode):
+            stack.append((node._node, False))
+        elif isinstance(node, VariableAssignNode):
+            stack.append((node.get_value_node(), False))
+    return reused, cached
+
+
+def share_subexpressions(node):
+    numbers = value_numbers(node)
+    reused, cached = find_repeats(node, numbers)
+    if not reused:
+        return node
+
+    # Post-order rebuild, only the nodes above a change are new
+    cached_nodes = {}
+    results = []
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node in reused:
+            results.append(ReusedNode(cached_nodes[numbers[node]], node))
+            continue
+        if not children_done:
+            stack.append((node, True))
+            if isinstance(node, BinaryOpNode):
+                stack.append((node.get_right_node(), False))
+                stack.append((node.get_left_node(), False))
+            elif isinstance(node, UnaryOpNode):
+                stack.append((node._node, False))
+            elif isinstance(node, VariableAssignNode):
+                stack.append((node.get_value_node(), False))
+            continue
+
+        new_node = node
+        if isinstance(node, BinaryOpNode):
+            right = results.pop()
+            left = results.pop()
+            if left is not node.get_left_node() or right is not node.get_right_node():
+                new_node = keep_position(BinaryOpNode(left, node.get_token(), right), node)
+        elif isinstance(node, UnaryOpNode):
+            child = results.pop()
+            if child is not node._node:
+                new_node = keep_position(UnaryOpNode(node.get_token(), child), node)
+        elif isinstance(node, VariableAssignNode):
+            value_node = results.pop()
+            if value_node is not node.get_value_node():
+                new_node = keep_position(VariableAssignNode(node.get_token(), value_node), node)
+
+        number = numbers[node]
+        if number in cached and number not in cached_nodes:
+            new_node = cached_nodes[number] = CachedNode(new_node, len(cached_nodes))
+        results.append(new_node)
+    return results.pop()
+
+
+def exec_optimizer(abstract_syntax_tree):
+    optimizer = Optimizer()
+    try:
+        return ParseResult().success(share_subexpressions(optimizer.optimize(abstract_syntax_tree._node, True)))
+    except RecursionError:
+        # Too deep to rewrite recursively, the tree runs as written
+        return abstract_syntax_tree
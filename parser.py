@@ -51,6 +51,22 @@ Example 02:
 
 So, what the parser has to do is to figure out if the tokens match our language grammar.
 And if it does generate a tree accordingly
+
+
+The grammar (grammar.text) is parsed by precedence climbing over two explicit
+stacks, one of operands (nodes built so far) and one of pending operators,
+instead of one recursive call per grammar rule:
+
+    >> 1 - 2 * 3
+
+    operands              operators        next token
+    [1]                   [ROOT]           MINUS  -> push, wait for operand
+    [1, 2]                [ROOT, -]        MUL    -> binds tighter, push
+    [1, 2, 3]             [ROOT, -, *]     EOF    -> fold *, then -
+    [(1, -, (2, *, 3))]   [ROOT]
+
+Parentheses and VAR assignments push a marker that opens a new expression,
+so ((((1)))) only grows the stacks and never Python's call stack.
 """
 
 ###########################################
@@ -58,20 +74,29 @@ And if it does generate a tree accordingly
 ###########################################
 
 from errors import InvalidSyntaxError
+from position import Position
 from tokens import TokenTypes
 
 
 class NumberNode:
+    __slots__ = ("_token", "_start", "_end")
+
     def __init__(self, token):
         self._token = token
-        self._start_pos = self._token.get_start_pos()
-        self._end_pos = self._token.get_end_pos()
+        self._start = self._token._start
+        self._end = self._token._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
 
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._token._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._token._source)
 
     def get_token(self):
         return self._token
@@ -81,53 +106,86 @@ class NumberNode:
 
 
 class VariableAccessNode:
+    __slots__ = ("_variable_name_token", "_slot", "_start", "_end")
+
     def __init__(self, variable_name_token):
         self._variable_name_token = variable_name_token
-        self._start_pos = self._variable_name_token.get_start_pos()
-        self._end_pos = self._variable_name_token.get_end_pos()
+        # Frame index, filled in by the resolver (see resolver.py)
+        self._slot = None
+        self._start = self._variable_name_token._start
+        self._end = self._variable_name_token._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
 
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._variable_name_token._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._variable_name_token._source)
 
     def get_token(self):
         return self._variable_name_token
 
+    def get_slot(self):
+        return self._slot
+
 
 class VariableAssignNode:
+    __slots__ = ("_variable_name_token", "_value_node", "_slot", "_start", "_end")
+
     def __init__(self, variable_name_token, value_node):
         self._variable_name_token = variable_name_token
         self._value_node = value_node
-        self._start_pos = self._variable_name_token.get_start_pos()
-        self._end_pos = self._value_node.get_end_pos()
+        self._slot = None
+        self._start = self._variable_name_token._start
+        self._end = self._value_node._end
 
     def get_token(self):
         return self._variable_name_token
 
+    def get_slot(self):
+        return self._slot
+
     def get_value_node(self):
         return self._value_node
 
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
+
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._variable_name_token._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._variable_name_token._source)
 
 
 class UnaryOpNode:
+    __slots__ = ("_operator_token", "_node", "_start", "_end")
+
     def __init__(self, operator_token, node):
         self._operator_token = operator_token
         self._node = node
-        self._start_pos = self._operator_token.get_start_pos()
-        self._end_pos = self._operator_token.get_end_pos()
+        self._start = self._operator_token._start
+        self._end = self._operator_token._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
 
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._operator_token._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._operator_token._source)
 
     def get_token(self):
         return self._operator_token
@@ -137,18 +195,26 @@ class UnaryOpNode:
 
 
 class BinaryOpNode:
+    __slots__ = ("_left_node", "_operator_token", "_right_node", "_start", "_end")
+
     def __init__(self, left_node, operator_token, right_node):
         self._left_node = left_node
         self._operator_token = operator_token
         self._right_node = right_node
-        self._start_pos = self._left_node.get_end_pos()
-        self._end_pos = self._right_node.get_end_pos()
+        self._start = self._left_node._end
+        self._end = self._right_node._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
 
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._operator_token._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._operator_token._source)
 
     def get_token(self):
         return self._operator_token
@@ -163,175 +229,278 @@ class BinaryOpNode:
         return f"({self._left_node}, {self._operator_token}, {self._right_node})"
 
 
+class CachedNode:
+    # First occurrence of a subtree the program repeats, its value is kept for
+    # the ReusedNodes of the later occurrences (see optimizer.py)
+    __slots__ = ("_node", "_index", "_start", "_end")
+
+    def __init__(self, node, index):
+        self._node = node
+        # Numbered from 0 within a tree, in evaluation order
+        self._index = index
+        self._start = node._start
+        self._end = node._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
+
+    def get_start_pos(self):
+        return Position(self._start, self._node.get_token()._source)
+
+    def get_end_pos(self):
+        return Position(self._end, self._node.get_token()._source)
+
+    def get_token(self):
+        return self._node.get_token()
+
+    def get_node(self):
+        return self._node
+
+    def get_index(self):
+        return self._index
+
+    def __repr__(self):
+        return f"{self._node}"
+
+
+class ReusedNode:
+    # A later occurrence of the subtree of a CachedNode, evaluates to the value
+    # the CachedNode kept. It keeps the token and span of the occurrence it
+    # replaces, the CachedNode is not one of its children
+    __slots__ = ("_cached", "_token", "_start", "_end")
+
+    def __init__(self, cached, node):
+        self._cached = cached
+        self._token = node.get_token()
+        self._start = node._start
+        self._end = node._end
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
+
+    def get_start_pos(self):
+        return Position(self._start, self._token._source)
+
+    def get_end_pos(self):
+        return Position(self._end, self._token._source)
+
+    def get_token(self):
+        return self._token
+
+    def get_cached(self):
+        return self._cached
+
+    def __repr__(self):
+        return f"{self._cached}"
+
+
+# Attributes holding the children of a node, a ReusedNode has none
+CHILD_ATTRIBUTES = ("_left_node", "_right_node", "_node", "_value_node")
+
+
+def iter_nodes(node):
+    # Every node of the tree under node, node included, in no particular order
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        for child in CHILD_ATTRIBUTES:
+            child_node = getattr(node, child, None)
+            if child_node is not None:
+                stack.append(child_node)
+
+
 class ParseResult:
     def __init__(self):
         self._error = None
         self._node = None
-        self._advance_count = 0
-
-    def register_advancement(self):
-        self._advance_count += 1
-
-    def register(self, res):
-        self._advance_count += res._advance_count
-        if res._error:
-            self._error = res._error
-        return res._node
+        # Variable name of each frame slot, set once the tree is resolved
+        self._slot_names = None
+        # Number of nodes of the tree, set with _slot_names
+        self._node_count = None
+        # Compiled Python function of the tree (see pycompiler.py)
+        self._py_program = None
 
     def success(self, node):
         self._node = node
         return self
 
     def failed(self, error):
-        if not self._error or self._advance_count == 0:
-            self._error = error
+        self._error = error
         return self
 
 
+# Binding powers of the binary operators as (left, right). An operator keeps
+# extending its right operand while the next operator's left power is at
+# least its right power: left associative operators have right = left + 1,
+# POWER has right < left so 2 ^ 3 ^ 2 is 2 ^ (3 ^ 2)
+BINARY_POWERS = {
+    TokenTypes.TT_PLUS: (10, 11),
+    TokenTypes.TT_MINUS: (10, 11),
+    TokenTypes.TT_MUL: (20, 21),
+    TokenTypes.TT_DIV: (20, 21),
+    TokenTypes.TT_POWER: (40, 30),
+}
+# Unary +/- applies to a factor: it takes in POWER but not MUL / DIV
+UNARY_POWER = 30
+
+# Kinds of operator stack entries. GROUP, ASSIGN and ROOT each open an
+# expression (grammar rule `expression`), UNARY and BINARY wait for an operand
+UNARY = 0
+BINARY = 1
+GROUP = 2
+ASSIGN = 3
+ROOT = 4
+
+
 class Parser:
     def __init__(self, tokens):
-        self._tokens = tokens
-        self._token_indx = -1
+        # Any iterable of tokens works, the parser never looks further than
+        # the current token so a lazy token stream is consumed as it goes
+        self._tokens = iter(tokens)
+        self._advance_count = 0
         self.current_token = None
         self.advance()
 
-    def binary_operation(self, function_a, operation_tokens, function_b=None):
-        if function_b == None:
-            function_b = function_a
-        res = ParseResult()
-        left_factor = res.register(function_a())
-        if res._error:
-            return res
-
-        while self.current_token._type in operation_tokens:
-            operator_token = self.current_token
-            res.register_advancement()
-            self.advance()
-            right_factor = res.register(function_b())
-            if res._error:
-                return res
-            left_factor = BinaryOpNode(left_factor, operator_token, right_factor)
-        return res.success(left_factor)
-
-    def atom(self):
-        res = ParseResult()
-        token = self.current_token
-
-        if token._type in [TokenTypes.TT_INT, TokenTypes.TT_FLOAT]:
-            res.register_advancement()
-            self.advance()
-            return res.success(NumberNode(token))
-
-        elif token.get_type() == TokenTypes.TT_IDENTIFIER:
-            res.register_advancement()
-            self.advance()
-            return res.success(VariableAccessNode(token))
-
-        elif token._type == TokenTypes.TT_LPAREN:
-            res.register_advancement()
-            self.advance()
-            expr = res.register(self.expression())
-            if res._error:
-                return res
-            if self.current_token._type == TokenTypes.TT_RPAREN:
-                res.register_advancement()
-                self.advance()
-                return res.success(expr)
-            else:
-                return res.failed(
-                    InvalidSyntaxError(
-                        self.current_token._start_pos, self.current_token._end_pos,
-                        "Expected ')'"
-                    )
-                )
-        return res.failed(
-            InvalidSyntaxError(
-                self.current_token._start_pos, self.current_token._end_pos,
-                "Expected INT, FLOAT, IDENTIFIER, '+', '-', '*' or '('"
-            )
-        )
-
-    def power(self):
-        return self.binary_operation(self.atom, [TokenTypes.TT_POWER], self.factor)
-
-    def factor(self):
-        res = ParseResult()
-        token = self.current_token
-
-        if token._type in [TokenTypes.TT_PLUS, TokenTypes.TT_MINUS]:
-            res.register_advancement()
-            self.advance()
-            factor = res.register(self.factor())
-            if res._error:
-                return res
-            return res.success(UnaryOpNode(token, factor))
+    def syntax_error(self, details):
+        return InvalidSyntaxError(self.current_token.get_start_pos(), self.current_token.get_end_pos(), details)
 
-        return self.power()
-
-    def term(self):
-        return self.binary_operation(self.factor, [TokenTypes.TT_MUL, TokenTypes.TT_DIV])
+    def expected_operand_error(self, operators):
+        # Nothing consumed since the innermost expression started: the
+        # expression as a whole was missing, not just an operand
+        for entry in reversed(operators):
+            if entry[0] >= GROUP:
+                if entry[2] == self._advance_count:
+                    return self.syntax_error("Expected VAR, int, float, identifier, '+', '-', '*' or '('")
+                break
+        return self.syntax_error("Expected INT, FLOAT, IDENTIFIER, '+', '-', '*' or '('")
 
     def expression(self):
-        res = ParseResult()
-        if self.current_token.matches(TokenTypes.TT_KEYWORD, "VAR"):
-            res.register_advancement()
-            self.advance()
-
-            if self.current_token.get_type() != TokenTypes.TT_IDENTIFIER:
-                res.failed(
-                    InvalidSyntaxError(
-                        self.current_token.get_start_pos(), self.current_token.get_end_pos(),
-                        "Expected identifier"
-                    )
-                )
-            var_name = self.current_token
-            res.register_advancement()
-            self.advance()
-
-            if self.current_token.get_type() != TokenTypes.TT_EQ:
-                res.failed(
-                    InvalidSyntaxError(
-                        self.current_token.get_start_pos(), self.current_token.get_end_pos(),
-                        "Expected '='"
-                    )
-                )
-            res.register_advancement()
-            self.advance()
-
-            expr = res.register(self.expression())
-            if res._error:
-                return res
-            return res.success(VariableAssignNode(var_name, expr))
-
-        node = res.register(self.binary_operation(self.term, [TokenTypes.TT_PLUS, TokenTypes.TT_MINUS]))
-        if res._error:
-            return res.failed(
-                InvalidSyntaxError(
-                    self.current_token._start_pos, self.current_token._end_pos,
-                    "Expected VAR, int, float, identifier, '+', '-', '*' or '('"
-                )
-            )
-        return res.success(node)
+        # Precedence climbing with explicit operator and operand stacks in
+        # place of the recursive expression / term / factor / power / atom
+        # calls, so nesting depth is only limited by memory. Returns the node,
+        # a syntax error is raised and caught once in parse / statements
+        operators = [(ROOT, None, self._advance_count, None)]
+        operands = []
+
+        while True:
+            # Operand position: prefixes, then an atom
+            token = self.current_token
+            token_type = token._type
+            if token_type == TokenTypes.TT_INT or token_type == TokenTypes.TT_FLOAT:
+                operands.append(NumberNode(token))
+                self.advance()
+            elif token_type == TokenTypes.TT_IDENTIFIER:
+                operands.append(VariableAccessNode(token))
+                self.advance()
+            elif token_type == TokenTypes.TT_PLUS or token_type == TokenTypes.TT_MINUS:
+                operators.append((UNARY, token))
+                self.advance()
+                continue
+            elif token_type == TokenTypes.TT_LPAREN:
+                self.advance()
+                operators.append((GROUP, token, self._advance_count, None))
+                continue
+            elif operators[-1][0] >= GROUP and token.matches(TokenTypes.TT_KEYWORD, "VAR"):
+                # Like the grammar, the name and '=' are consumed whatever
+                # they are; the first mismatch is reported only if the value
+                # expression itself parses
+                self.advance()
+                error = None
+                if self.current_token._type != TokenTypes.TT_IDENTIFIER:
+                    error = self.syntax_error("Expected identifier")
+                var_name = self.current_token
+                self.advance()
+                if self.current_token._type != TokenTypes.TT_EQ and error is None:
+                    error = self.syntax_error("Expected '='")
+                self.advance()
+                operators.append((ASSIGN, var_name, self._advance_count, error))
+                continue
+            else:
+                raise self.expected_operand_error(operators)
+
+            # Operator position: fold what the next token ends, then either
+            # wait for its right operand or close the innermost expression
+            while True:
+                token = self.current_token
+                powers = BINARY_POWERS.get(token._type)
+                left_power = powers[0] if powers else -1
+                while True:
+                    entry = operators[-1]
+                    if entry[0] == UNARY:
+                        if left_power >= UNARY_POWER:
+                            break
+                        operands[-1] = UnaryOpNode(entry[1], operands[-1])
+                    elif entry[0] == BINARY:
+                        if left_power >= entry[2]:
+                            break
+                        right_node = operands.pop()
+                        operands[-1] = BinaryOpNode(operands[-1], entry[1], right_node)
+                    else:
+                        break
+                    operators.pop()
+
+                if powers:
+                    operators.append((BINARY, token, powers[1]))
+                    self.advance()
+                    break
+
+                entry = operators.pop()
+                if entry[0] == ROOT:
+                    return operands.pop()
+                if entry[0] == ASSIGN:
+                    if entry[3]:
+                        raise entry[3]
+                    operands[-1] = VariableAssignNode(entry[1], operands[-1])
+                elif token._type == TokenTypes.TT_RPAREN:
+                    self.advance()
+                else:
+                    raise self.syntax_error("Expected ')'")
 
     def advance(self):
-        self._token_indx += 1
-        if self._token_indx < len(self._tokens):
-            self.current_token = self._tokens[self._token_indx]
+        self._advance_count += 1
+        self.current_token = next(self._tokens, self.current_token)
         return self.current_token
 
     def parse(self):
-        res = self.expression()
-        if not res._error and self.current_token._type != TokenTypes.TT_EOF:
-            return res.failed(
-                InvalidSyntaxError(
-                    self.current_token._start_pos, self.current_token._end_pos,
-                    "Expected '+', '-', '*' or '/'"
-                )
-            )
-        return res
+        res = ParseResult()
+        try:
+            node = self.expression()
+            if self.current_token._type != TokenTypes.TT_EOF:
+                raise self.syntax_error("Expected '+', '-', '*' or '/'")
+        except InvalidSyntaxError as error:
+            return res.failed(error)
+        return res.success(node)
+
+    def statements(self):
+        while True:
+            while self.current_token._type == TokenTypes.TT_NEWLINE:
+                self.advance()
+            if self.current_token._type == TokenTypes.TT_EOF:
+                return
+            res = ParseResult()
+            try:
+                node = self.expression()
+                if self.current_token._type not in (TokenTypes.TT_NEWLINE, TokenTypes.TT_EOF):
+                    raise self.syntax_error("Expected '+', '-', '*', '/' or newline")
+            except InvalidSyntaxError as error:
+                yield res.failed(error)
+                return
+            yield res.success(node)
 
 
 def exec_parser(tokens):
     parser = Parser(tokens)
     ast = parser.parse()
     return ast
+
+
+def exec_stream_parser(tokens):
+    parser = Parser(tokens)
+    return parser.statements()
@@ -2,22 +2,109 @@
 # Position
 ########################
 
+"""
+Tokens and nodes only keep integer offsets into their Source. Line and
+column numbers are needed only to render an error, so they are worked out
+on demand: the Source builds a table with the offset of every line start
+the first time it is asked, and finds the line of an offset with bisect.
+"""
+
+from bisect import bisect_right
+
+
+class Source:
+    __slots__ = ("_f_name", "_text", "_line_starts")
+
+    def __init__(self, f_name, text):
+        self._f_name = f_name
+        self._text = text
+        self._line_starts = None
+
+    def get_f_name(self):
+        return self._f_name
+
+    def get_text(self):
+        return self._text
+
+    def get_line_starts(self):
+        if self._line_starts is None:
+            line_starts = [0]
+            find = self._text.find
+            indx = find("\n")
+            while indx >= 0:
+                line_starts.append(indx + 1)
+                indx = find("\n", indx + 1)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def line_of(self, indx):
+        return bisect_right(self.get_line_starts(), indx) - 1
+
+    def line_start(self, ln_num):
+        return self.get_line_starts()[ln_num]
+
+    def line_end(self, ln_num):
+        # End of the line's text, without its newline
+        line_starts = self.get_line_starts()
+        if ln_num + 1 < len(line_starts):
+            return line_starts[ln_num + 1] - 1
+        return len(self._text)
+
+
 class Position:
-    def __init__(self, indx, ln_num, col_num, f_name, f_txt):
+    __slots__ = ("_indx", "_source")
+
+    def __init__(self, indx, source):
         self._indx = indx
-        self._ln_num = ln_num
-        self._col_num = col_num
-        self._f_name = f_name
-        self._f_txt = f_txt
+        self._source = source
 
-    def advance(self, current_char=None):
-        self._indx += 1
-        self._col_num += 1
+    def get_indx(self):
+        return self._indx
+
+    def get_source(self):
+        return self._source
+
+    def get_f_name(self):
+        return self._source._f_name
+
+    def get_ln_num(self):
+        return self._source.line_of(self._indx)
 
-        if current_char == "\n":
-            self._ln_num += 1
-            self._col_num = 0
+    def get_col_num(self):
+        return self._indx - self._source.line_start(self.get_ln_num())
+
+    def advance(self):
+        self._indx += 1
         return self
 
     def copy(self):
-        return Position(self._indx, self._ln_num, self._col_num, self._f_name, self._f_txt)
+        return Position(self._indx, self._source)
+
+
+# Wraps a bytes-like buffer (typically an mmap of a script file) so it can
+# stand in for the source text of a Position. The lexer scans the buffer
+# directly and only the pieces needed to render an error are decoded.
+# Offsets are byte offsets, the same as character offsets for ASCII source.
+class MappedText:
+    def __init__(self, buffer, encoding="utf-8"):
+        self._buffer = buffer
+        self._encoding = encoding
+
+    def get_buffer(self):
+        return self._buffer
+
+    def char_at(self, indx):
+        # The character starting at byte indx, even when it is multi-byte
+        return self._buffer[indx:indx + 4].decode(self._encoding, "replace")[:1]
+
+    def find(self, sub, start=0, end=None):
+        return self._buffer.find(sub.encode(self._encoding), start, len(self) if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        return self._buffer.rfind(sub.encode(self._encoding), start, len(self) if end is None else end)
+
+    def __getitem__(self, key):
+        return self._buffer[key].decode(self._encoding, "replace")
+
+    def __len__(self):
+        return len(self._buffer)
@@ -0,0 +1,335 @@
+#########################
+# PYTHON COMPILER
+#########################
+
+"""
+The Python compiler translates the syntax tree into a Python function,
+built as an `ast.Module` and compiled with compile(), so CPython's own
+bytecode loop does the arithmetic:
+
+    >> VAR x = (y + 1) / z
+
+    def program(frame, assigned, budget):
+        s0, s1, s2 = frame
+        a0 = None
+        try:
+            return (s0 := (s1 + 1) / s2, a0 := 0)[0]
+        finally:
+            frame[0] = s0
+            assigned[0] = a0
+
+Variables are the frame slots of the resolver (see resolver.py) held in
+locals. Each division, undefined variable read and assignment in the tree
+is a numbered site, and errors are mapped back to the BASIC source through
+the sites:
+
+    Division by zero    Every division is compiled on its own line, line
+                        FIRST_SITE_LINE + site. Python raises the
+                        ZeroDivisionError itself, and the line of the
+                        traceback tells which division failed.
+    Undefined variable  Only possible when a slot is None as the program
+                        starts, then a variant of the function checking
+                        each read is used, see PyProgram.run.
+    Limits              Runs with a budget (see limits.py) use a variant
+                        where every * and ^ is a budget.multiply /
+                        budget.power call, on its own line like a division.
+
+A subexpression the optimizer found repeated (see optimizer.py) is kept in
+a local t<index> by its first occurrence, (t0 := a * b + c), and read from
+it by the others.
+
+The compiled functions are cached on the PyProgram, which is cached on the
+ParseResult it was compiled from.
+"""
+
+import ast
+
+from compiler import value_positions
+from errors import RTError
+from interpreter import (
+    Number,
+    make_program_context
+)
+from limits import LimitExceeded
+from parser import (
+    UnaryOpNode,
+    BinaryOpNode,
+    VariableAssignNode,
+    CachedNode
+)
+from resolver import exec_resolver, load_frame
+from tokens import TokenTypes
+
+# Line of every generated node that is not a division
+PLAIN_LINE = 1
+FIRST_SITE_LINE = 2
+
+PY_BINARY_OPS = {
+    TokenTypes.TT_PLUS: ast.Add,
+    TokenTypes.TT_MINUS: ast.Sub,
+    TokenTypes.TT_MUL: ast.Mult,
+    TokenTypes.TT_DIV: ast.Div,
+    TokenTypes.TT_POWER: ast.Pow,
+}
+
+# Budget methods of the operators checked by limits.py
+LIMITED_METHODS = {
+    TokenTypes.TT_MUL: "multiply",
+    TokenTypes.TT_POWER: "power",
+}
+
+
+class UndefinedName(Exception):
+    # Raised by the generated code when a variable is read while it has no value
+    def __init__(self, site):
+        super().__init__(site)
+        self._site = site
+
+
+def undefined(site):
+    raise UndefinedName(site)
+
+
+def located(node, line=PLAIN_LINE):
+    node.lineno = node.end_lineno = line
+    node.col_offset = 0
+    node.end_col_offset = 1
+    return node
+
+
+def load(name):
+    return ast.Name(name, ast.Load())
+
+
+def store(name):
+    return ast.Name(name, ast.Store())
+
+
+class PyCompiler:
+    def __init__(self, names, checked, limited):
+        self._names = names
+        # Whether variable reads check for a missing value
+        self._checked = checked
+        # Whether * and ^ go through the budget
+        self._limited = limited
+        self._sites = []
+        self._assigned_slots = set()
+        self._stack = []
+
+    def site(self, node):
+        self._sites.append(node)
+        return len(self._sites) - 1
+
+    def no_visit_method(self, node):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    # Each visit method replaces the expressions of its children on the stack
+    # by its own expression
+
+    def visit_NumberNode(self, node):
+        self._stack.append(ast.Constant(node.get_token().get_value()))
+
+    def visit_VariableAccessNode(self, node):
+        slot_name = f"s{node._slot}"
+        if not self._checked:
+            self._stack.append(load(slot_name))
+            return
+        self._stack.append(ast.IfExp(
+            ast.Compare(load(slot_name), [ast.IsNot()], [ast.Constant(None)]),
+            load(slot_name),
+            ast.Call(load("_undefined"), [ast.Constant(self.site(node))], [])
+        ))
+
+    def visit_VariableAssignNode(self, node):
+        # (s := value, a := site)[0], the site is only recorded once the
+        # value is computed
+        self._assigned_slots.add(node._slot)
+        value = self._stack.pop()
+        self._stack.append(ast.Subscript(
+            ast.Tuple([
+                ast.NamedExpr(store(f"s{node._slot}"), value),
+                ast.NamedExpr(store(f"a{node._slot}"), ast.Constant(self.site(node)))
+            ], ast.Load()),
+            ast.Constant(0),
+            ast.Load()
+        ))
+
+    def visit_UnaryOpNode(self, node):
+        if node.get_token().get_type() == TokenTypes.TT_MINUS:
+            self._stack.append(ast.UnaryOp(ast.USub(), self._stack.pop()))
+
+    def visit_CachedNode(self, node):
+        self._stack.append(ast.NamedExpr(store(f"t{node._index}"), self._stack.pop()))
+
+    def visit_ReusedNode(self, node):
+        self._stack.append(load(f"t{node._cached._index}"))
+
+    def visit_BinaryOpNode(self, node):
+        token_type = node.get_token().get_type()
+        right = self._stack.pop()
+        left = self._stack.pop()
+        if self._limited and token_type in LIMITED_METHODS:
+            # A method call is reported at the line of its attribute
+            line = FIRST_SITE_LINE + self.site(node)
+            method = located(ast.Attribute(load("budget"), LIMITED_METHODS[token_type], ast.Load()), line)
+            expression = located(ast.Call(method, [left, right], []), line)
+        else:
+            expression = ast.BinOp(left, PY_BINARY_OPS[token_type](), right)
+        if token_type == TokenTypes.TT_DIV:
+            located(expression, FIRST_SITE_LINE + self.site(node))
+        self._stack.append(expression)
+
+    def compile(self, node):
+        # Post-order walk over an explicit stack, as in Compiler.compile
+        stack = [(node, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                method_name = f"visit_{type(node).__name__}"
+                getattr(self, method_name, self.no_visit_method)(node)
+                continue
+            stack.append((node, True))
+            if isinstance(node, BinaryOpNode):
+                stack.append((node.get_right_node(), False))
+                stack.append((node.get_left_node(), False))
+            elif isinstance(node, UnaryOpNode):
+                stack.append((node._node, False))
+            elif isinstance(node, VariableAssignNode):
+                stack.append((node.get_value_node(), False))
+            elif isinstance(node, CachedNode):
+                stack.append((node._node, False))
+
+    def finish(self):
+        assigned_slots = sorted(self._assigned_slots)
+        body = []
+        if self._names:
+            targets = [store(f"s{slot}") for slot in range(len(self._names))]
+            body.append(ast.Assign([ast.Tuple(targets, ast.Store())], load("frame")))
+        for slot in assigned_slots:
+            body.append(ast.Assign([store(f"a{slot}")], ast.Constant(None)))
+
+        returned = ast.Return(self._stack.pop())
+        if assigned_slots:
+            # Assignments made before an error are handed back as well
+            write_back = []
+            for slot in assigned_slots:
+                write_back.append(ast.Assign(
+                    [ast.Subscript(load("frame"), ast.Constant(slot), ast.Store())], load(f"s{slot}")
+                ))
+                write_back.append(ast.Assign(
+                    [ast.Subscript(load("assigned"), ast.Constant(slot), ast.Store())], load(f"a{slot}")
+                ))
+            body.append(ast.Try([returned], [], [], write_back))
+        else:
+            body.append(returned)
+
+        parameters = [ast.arg("frame"), ast.arg("assigned"), ast.arg("budget")]
+        arguments = ast.arguments([], parameters, None, [], [], None, [])
+        module = ast.Module([ast.FunctionDef("program", arguments, body, [], None)], [])
+        for node in ast.walk(module):
+            if "lineno" in node._attributes and not hasattr(node, "lineno"):
+                located(node)
+
+        namespace = {"_undefined": undefined}
+        exec(compile(module, "<basic>", "exec"), namespace)
+        function = namespace["program"]
+        return function, function.__code__, self._sites
+
+
+def error_site(error, code):
+    # Line of the innermost traceback entry in the generated function
+    line = None
+    traceback = error.__traceback__
+    while traceback:
+        if traceback.tb_frame.f_code is code:
+            line = traceback.tb_lineno
+        traceback = traceback.tb_next
+    if line is None or line < FIRST_SITE_LINE:
+        return None
+    return line - FIRST_SITE_LINE
+
+
+class PyProgram:
+    def __init__(self, root, names, node_count):
+        self._root = root
+        self._names = names
+        self._node_count = node_count
+        # (function, code, sites) keyed by whether reads are checked and
+        # whether the run has a budget
+        self._variants = {}
+        # value_positions of the root and of assignments, shared by every run
+        self._positions = {}
+
+    def get_positions(self, node):
+        positions = self._positions.get(node)
+        if positions is None:
+            positions = self._positions[node] = value_positions(node)
+        return positions
+
+    def get_variant(self, checked, limited):
+        variant = self._variants.get((checked, limited))
+        if variant is None:
+            compiler = PyCompiler(self._names, checked, limited)
+            compiler.compile(self._root)
+            variant = self._variants[(checked, limited)] = compiler.finish()
+        return variant
+
+    def run(self, context, budget=None):
+        root = self._root
+        if budget is not None:
+            try:
+                budget.spend(self._node_count)
+            except LimitExceeded as error:
+                start_pos, end_pos = self.get_positions(root)
+                return None, RTError(start_pos, end_pos, error.get_details(), context)
+        frame = load_frame(self._names, context._symbol_table)
+        # Assignments never store None, so reads can only fail when a slot
+        # is missing as the program starts
+        try:
+            function, code, sites = self.get_variant(None in frame, budget is not None)
+        except RecursionError:
+            # compile() has a nesting limit of its own, the VM engine has none
+            return None, RTError(root.get_start_pos(), root.get_end_pos(), "Expression is nested too deeply", context)
+
+        assigned = [None] * len(self._names)
+        try:
+            value = function(frame, assigned, budget)
+        except UndefinedName as error:
+            node = sites[error._site]
+            var_name = node.get_token().get_value()
+            return None, RTError(node.get_start_pos(), node.get_end_pos(), f"'{var_name}' is not defined.", context)
+        except ZeroDivisionError as error:
+            site = error_site(error, code)
+            if site is None or sites[site].get_token().get_type() != TokenTypes.TT_DIV:
+                # Not a division, 0 ^ -1 fails like it does in the other engines
+                raise
+            start_pos, end_pos = value_positions(sites[site].get_right_node())
+            return None, RTError(start_pos, end_pos, "Division by Zero", context)
+        except LimitExceeded as error:
+            node = sites[error_site(error, code)]
+            return None, RTError(node.get_start_pos(), node.get_end_pos(), error.get_details(), context)
+        finally:
+            for slot, site in enumerate(assigned):
+                if site is not None:
+                    start_pos, end_pos = self.get_positions(sites[site])
+                    number = Number(frame[slot]).set_context(context).set_position(start_pos, end_pos)
+                    context._symbol_table.set(self._names[slot], number)
+
+        start_pos, end_pos = self.get_positions(root)
+        return Number(value).set_context(context).set_position(start_pos, end_pos), None
+
+
+def exec_pycompiler(abstract_syntax_tree):
+    if abstract_syntax_tree._py_program is None:
+        if abstract_syntax_tree._slot_names is None:
+            exec_resolver(abstract_syntax_tree)
+        abstract_syntax_tree._py_program = PyProgram(
+            abstract_syntax_tree._node, abstract_syntax_tree._slot_names, abstract_syntax_tree._node_count
+        )
+    return abstract_syntax_tree._py_program
+
+
+def exec_pyprogram(program, context=None, budget=None):
+    if context is None:
+        context = make_program_context()
+    return program.run(context, budget)
@@ -0,0 +1,256 @@
+#########################
+# REACTIVE
+#########################
+
+"""
+A Sheet treats VAR assignments like spreadsheet cells. Every assignment is
+kept as the formula of the variable it assigns, and when a variable is
+assigned again only the formulas that read it, directly or through other
+formulas, are evaluated again, each after the formulas it reads:
+
+    >> sheet = reactive.Sheet()
+    >> sheet.assign("<cell>", "VAR price = 20")
+    >> sheet.assign("<cell>", "VAR tax = price * 0.2")
+    >> sheet.assign("<cell>", "VAR total = price + tax")
+    >> sheet.assign("<cell>", "VAR price = 30")
+    (30, None)
+    >> sheet.get_last_recomputed()
+    ['tax', 'total']
+    >> sheet.assign("<cell>", "VAR price = total - 1")
+    (None, RTError "Circular dependency: price -> total -> price")
+
+The language has no branches, so the variables a formula reads are those
+its tree reads before assigning them, in evaluation order (see
+formula_names). They are known before the formula runs, so a formula
+closing a cycle is rejected before anything is assigned, and a formula that
+fails half way keeps every dependency it would have had.
+
+A formula that fails leaves its variable, and every variable its nested
+VARs assign, undefined, so the formulas reading them fail with "'x' is not
+defined." until it is fixed. A formula can
+assign other variables inside it (VAR a = (VAR b = 2) * 3), those belong
+to its cell and cannot have a formula of their own. Statements that are
+not an assignment run once against the sheet's variables and are not
+kept, the cells reading what they assign are evaluated again.
+"""
+
+import threading
+from collections import deque
+
+import basic
+import interpreter
+from errors import RTError
+from parser import (
+    UnaryOpNode,
+    BinaryOpNode,
+    VariableAccessNode,
+    VariableAssignNode
+)
+
+
+def formula_names(node):
+    # (names read before being assigned, names assigned) by the tree, in the
+    # order the interpreter evaluates it. Dicts keep the order of first use
+    reads = {}
+    writes = {}
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if isinstance(node, VariableAccessNode):
+            name = node.get_token().get_value()
+            if name not in writes:
+                reads.setdefault(name)
+        elif isinstance(node, VariableAssignNode):
+            if children_done:
+                writes.setdefault(node.get_token().get_value())
+            else:
+                stack.append((node, True))
+                stack.append((node.get_value_node(), False))
+        elif isinstance(node, BinaryOpNode):
+            stack.append((node.get_right_node(), False))
+            stack.append((node.get_left_node(), False))
+        elif isinstance(node, UnaryOpNode):
+            stack.append((node._node, False))
+    return list(reads), list(writes)
+
+
+class Formula:
+    __slots__ = ("_name", "_ast", "_reads", "_writes", "_result", "_error")
+
+    def __init__(self, name, ast, reads, writes):
+        self._name = name
+        self._ast = ast
+        self._reads = reads
+        self._writes = writes
+        # Outcome of the last evaluation
+        self._result = None
+        self._error = None
+
+    def get_name(self):
+        return self._name
+
+    def get_reads(self):
+        return self._reads
+
+    def get_writes(self):
+        return self._writes
+
+
+class Sheet:
+    def __init__(self, symbol_table=None):
+        self._session = basic.Session(symbol_table)
+        self._lock = threading.Lock()
+        # Cell name -> Formula
+        self._formulas = {}
+        # Variable name -> name of the cell whose formula assigns it
+        self._owners = {}
+        # Variable name -> names of the cells whose formulas read it
+        self._dependents = {}
+        self._last_recomputed = []
+
+    def get_session(self):
+        return self._session
+
+    def get_formula(self, name):
+        return self._formulas.get(name)
+
+    def get_dependents(self, name):
+        return sorted(self._dependents.get(name, ()))
+
+    def get_last_recomputed(self):
+        # Cells evaluated again by the last assign / remove, in order
+        return self._last_recomputed
+
+    def get(self, name):
+        # (result, error) of the formula of a cell
+        formula = self._formulas.get(name)
+        if formula is None:
+            return None, None
+        return formula._result, formula._error
+
+    def assign(self, f_name, text):
+        ast, error = basic.load_program(f_name, text, basic.ENGINE_INTERPRETER, False, basic.COMPILE_CACHE)
+        if error:
+            return None, error
+        node = ast._node
+        context = self._session.get_context()
+        with self._lock:
+            self._last_recomputed = []
+            reads, writes = formula_names(node)
+            name = node.get_token().get_value() if isinstance(node, VariableAssignNode) else None
+            for write in writes:
+                owner = self._owners.get(write, name)
+                if owner != name:
+                    details = f"'{write}' is assigned by the formula of '{owner}'"
+                    return None, RTError(node.get_start_pos(), node.get_end_pos(), details, context)
+            if name is None:
+                result, error = interpreter.exec_interpreter(ast, context)
+                self._last_recomputed = self.recompute(writes)
+                return result, error
+
+            cycle = self.find_cycle(name, reads, writes)
+            if cycle:
+                details = "Circular dependency: " + " -> ".join(cycle)
+                return None, RTError(node.get_start_pos(), node.get_end_pos(), details, context)
+
+            formula = Formula(name, ast, reads, writes)
+            self.replace(name, formula)
+            self.evaluate(formula)
+            self._last_recomputed = self.recompute(writes)
+            return formula._result, formula._error
+
+    def remove(self, name):
+        # Drops the formula of a cell, its variables become undefined and the
+        # cells reading them are evaluated again
+        with self._lock:
+            formula = self._formulas.get(name)
+            if formula is None:
+                return
+            self.replace(name, None)
+            symbol_table = self._session.get_symbol_table()
+            for write in formula._writes:
+                if symbol_table.defines(write):
+                    symbol_table.remove(write)
+            self._last_recomputed = self.recompute(formula._writes)
+
+    def replace(self, name, formula):
+        old = self._formulas.pop(name, None)
+        if old is not None:
+            for read in old._reads:
+                readers = self._dependents[read]
+                readers.discard(name)
+                if not readers:
+                    del self._dependents[read]
+            for write in old._writes:
+                del self._owners[write]
+        if formula is not None:
+            self._formulas[name] = formula
+            for read in formula._reads:
+                self._dependents.setdefault(read, set()).add(name)
+            for write in formula._writes:
+                self._owners[write] = name
+
+    def downstream(self, names):
+        # Cells reading names, directly or through other cells, with the cell
+        # each one was reached from
+        reached_from = {}
+        queue = deque((None, name) for name in names)
+        while queue:
+            parent, name = queue.popleft()
+            for reader in sorted(self._dependents.get(name, ())):
+                if reader not in reached_from:
+                    reached_from[reader] = parent
+                    queue.extend((reader, write) for write in self._formulas[reader]._writes)
+        return reached_from
+
+    def find_cycle(self, name, reads, writes):
+        # Cells of the cycle the formula would close, from name back to name,
+        # None if it closes none
+        if any(read in writes for read in reads):
+            return [name, name]
+        reached_from = self.downstream(writes)
+        reached_from.pop(name, None)
+        for read in reads:
+            owner = self._owners.get(read)
+            if owner in reached_from:
+                path = [owner]
+                while reached_from[path[-1]] is not None:
+                    path.append(reached_from[path[-1]])
+                return [name] + path[::-1] + [name]
+        return None
+
+    def recompute(self, names):
+        # Evaluates the cells downstream of names, every cell after the cells
+        # it reads (Kahn's algorithm over the affected cells only)
+        affected = self.downstream(names)
+        waiting = {}
+        readers = {cell: [] for cell in affected}
+        for cell in affected:
+            sources = {self._owners.get(read) for read in self._formulas[cell]._reads}
+            sources = [source for source in sources if source in affected]
+            waiting[cell] = len(sources)
+            for source in sources:
+                readers[source].append(cell)
+
+        order = []
+        ready = deque(cell for cell in affected if waiting[cell] == 0)
+        while ready:
+            cell = ready.popleft()
+            self.evaluate(self._formulas[cell])
+            order.append(cell)
+            for reader in readers[cell]:
+                waiting[reader] -= 1
+                if waiting[reader] == 0:
+                    ready.append(reader)
+        return order
+
+    def evaluate(self, formula):
+        context = self._session.get_context()
+        formula._result, formula._error = interpreter.exec_interpreter(formula._ast, context)
+        if formula._error is not None:
+            # Readers of a failed cell fail too, instead of reading its last
+            # values or those its nested VARs assigned before it failed
+            symbol_table = context._symbol_table
+            for write in formula._writes:
+                if symbol_table.defines(write):
+                    symbol_table.remove(write)
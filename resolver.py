@@ -0,0 +1,85 @@
+#########################
+# RESOLVER
+#########################
+
+"""
+The resolver gives every variable of a program a fixed slot in a frame,
+so the interpreter reads and writes variables by index instead of looking
+names up in the symbol table on every access:
+
+    >> VAR x = y * (VAR y = 2) + x
+
+    slot 0  x    VariableAssignNode x, VariableAccessNode x
+    slot 1  y    VariableAccessNode y, VariableAssignNode y
+
+Slots are numbered in order of first appearance and stored on the nodes,
+the names of the slots are kept on the ParseResult. The optimizer never
+adds or reorders variable nodes, and only drops those of a subtree repeated
+after its first occurrence, so an optimized tree sharing nodes with the
+tree it came from numbers them the same way.
+
+At run time a frame is a list with one value per slot, loaded from the
+symbol table when the program starts (None for a name that is not
+defined) and written back to it when the program ends.
+
+The resolver also counts the nodes of the tree, the steps of a run of it
+(see limits.py).
+"""
+
+from parser import (
+    UnaryOpNode,
+    BinaryOpNode,
+    VariableAccessNode,
+    VariableAssignNode,
+    CachedNode
+)
+
+
+class Resolver:
+    def __init__(self):
+        self._names = []
+        self._slots = {}
+        self._node_count = 0
+
+    def slot(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slots[name] = len(self._names)
+            self._names.append(name)
+        return slot
+
+    def resolve(self, node):
+        # Pre-order walk over an explicit stack, children pushed right to left
+        # so names are met in source order
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self._node_count += 1
+            if isinstance(node, BinaryOpNode):
+                stack.append(node.get_right_node())
+                stack.append(node.get_left_node())
+            elif isinstance(node, UnaryOpNode):
+                stack.append(node._node)
+            elif isinstance(node, VariableAssignNode):
+                node._slot = self.slot(node.get_token().get_value())
+                stack.append(node.get_value_node())
+            elif isinstance(node, VariableAccessNode):
+                node._slot = self.slot(node.get_token().get_value())
+            elif isinstance(node, CachedNode):
+                stack.append(node._node)
+        return self._names
+
+
+def load_frame(names, symbol_table):
+    frame = []
+    for name in names:
+        number = symbol_table.get(name)
+        frame.append(None if number is None else number._value)
+    return frame
+
+
+def exec_resolver(abstract_syntax_tree):
+    resolver = Resolver()
+    abstract_syntax_tree._slot_names = resolver.resolve(abstract_syntax_tree._node)
+    abstract_syntax_tree._node_count = resolver._node_count
+    return abstract_syntax_tree
@@ -0,0 +1,264 @@
+#########################
+# SERVER
+#########################
+
+"""
+An asyncio evaluation server speaking newline delimited JSON over TCP or a
+Unix socket:
+
+    python server.py --port 8765
+    python server.py --unix /tmp/basic.sock
+    python server.py --port 8765 --max-steps 100000 --timeout 0.5 --max-int-bits 65536
+
+Every line sent is one request, every line received is the reply to one
+request, in the order the requests were sent:
+
+    >> {"id": 1, "source": "VAR x = 2 ^ 10"}
+    << {"id": 1, "result": 1024, "error": null, "latency": 0.0002}
+    >> {"id": 2, "source": "x / 0", "engine": "vm"}
+    << {"id": 2, "result": null, "error": "Traceback ... Division by Zero ...", "latency": 0.0001}
+    >> {"id": 3, "op": "stats"}
+    << {"id": 3, "result": {"connections": 1, "queue_depth": 0, ...}, "error": null, "latency": 0.0}
+
+A request is {"id", "source", "engine", "optimize"} with "op": "run", the
+default, or {"id", "op": "stats"}. A source with several lines runs as
+newline separated statements, the reply carries the last statement's
+result. "latency" is the time in seconds from reading the request to
+writing its reply, queueing included. Replies are strict JSON: a result
+JSON has no number for (inf, nan, a complex, an int longer than Python
+writes) is sent as its text, and a reply that still cannot be encoded is
+sent as an error.
+
+Each connection gets a basic.Session of its own, so clients never see
+each other's variables. Clients can pipeline: requests are read as soon
+as they arrive and queued per connection, and run one after the other so
+a request sees the variables of those sent before it. Evaluations run on
+a thread pool so the event loop keeps accepting connections and reading
+requests while a long evaluation runs. A connection stops being read once
+MAX_PENDING of its requests are queued, until the queue drains.
+
+With limits (see limits.py), every request runs with a budget of its own,
+so one expensive request cannot hold an evaluation thread for long. Going
+over a limit is an error reply like any other runtime error.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import basic
+from limits import DEFAULT_MAX_INT_BITS, Limits
+
+# Requests queued per connection before reading from it pauses
+MAX_PENDING = 1024
+# Longest request line in bytes
+MAX_LINE = 1 << 20
+# Number of most recent request latencies kept for the stats
+LATENCY_WINDOW = 4096
+# Ints of fewer bits have fewer digits than the lowest limit of
+# sys.set_int_max_str_digits, so str() always writes them
+SHORT_INT_BITS = 2000
+
+
+class ServerStats:
+    def __init__(self, window=LATENCY_WINDOW):
+        self._connections = 0
+        self._requests = 0
+        self._errors = 0
+        # Requests read but not answered yet, over all connections
+        self._queue_depth = 0
+        self._latencies = deque(maxlen=window)
+
+    def record(self, latency, failed):
+        self._requests += 1
+        if failed:
+            self._errors += 1
+        self._latencies.append(latency)
+
+    def as_dict(self):
+        latencies = sorted(self._latencies)
+        if latencies:
+            latency = {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p99": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+                "max": latencies[-1],
+            }
+        else:
+            latency = {"count": 0, "mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "connections": self._connections,
+            "requests": self._requests,
+            "errors": self._errors,
+            "queue_depth": self._queue_depth,
+            "latency": latency,
+        }
+
+
+def json_value(value):
+    # int and finite float go out as JSON numbers, anything else (inf, nan, a
+    # complex from a negative base to a fractional power) as its text. An int
+    # with more digits than sys.get_int_max_str_digits() goes out as text,
+    # written by Decimal which has no such limit
+    if type(value) is int:
+        if value.bit_length() > SHORT_INT_BITS:
+            try:
+                str(value)
+            except ValueError:
+                return str(Decimal(value))
+        return value
+    if type(value) is float and math.isfinite(value):
+        return value
+    return str(value)
+
+
+def reject_constant(name):
+    # json.loads accepts NaN and Infinity, strict JSON does not
+    raise ValueError(f"'{name}' is not valid JSON")
+
+
+def evaluate(session, request):
+    # Runs on the executor, returns (result, error text)
+    source = request.get("source")
+    if not isinstance(source, str):
+        return None, "Invalid request: 'source' must be a string"
+    engine = request.get("engine", basic.ENGINE_INTERPRETER)
+    if engine not in basic.ENGINES:
+        return None, f"Invalid request: unknown engine '{engine}', expected one of {', '.join(basic.ENGINES)}"
+    optimize = bool(request.get("optimize", False))
+    try:
+        if "\n" in source:
+            result, error = session.run_program("<request>", source, engine, optimize)
+        else:
+            # A single statement goes through the compile cache
+            result, error = session.run("<request>", source, engine, optimize)
+    except Exception as exception:
+        return None, f"{type(exception).__name__}: {exception}"
+    if error:
+        return None, error.as_string()
+    return None if result is None else json_value(result._value), None
+
+
+class EvaluationServer:
+    def __init__(self, executor=None, max_pending=MAX_PENDING, limits=None):
+        self._executor = executor if executor is not None else ThreadPoolExecutor()
+        self._max_pending = max_pending
+        # Limits of every request, None for none
+        self._limits = limits
+        self._stats = ServerStats()
+
+    def get_stats(self):
+        return self._stats
+
+    async def handle_connection(self, reader, writer):
+        self._stats._connections += 1
+        session = basic.Session(limits=self._limits)
+        queue = asyncio.Queue(self._max_pending)
+        answering = asyncio.ensure_future(self.answer_requests(session, queue, writer))
+        try:
+            await self.read_requests(reader, queue)
+            # Requests already read are still answered, then the connection closes
+            await queue.put(None)
+            await answering
+        finally:
+            answering.cancel()
+            self._stats._connections -= 1
+            writer.close()
+
+    async def read_requests(self, reader, queue):
+        while True:
+            try:
+                line = await reader.readline()
+            except (ValueError, ConnectionError):
+                # Line over MAX_LINE, or the client went away
+                return
+            if not line:
+                return
+            if not line.strip():
+                continue
+            self._stats._queue_depth += 1
+            await queue.put((line, time.perf_counter()))
+
+    async def answer_requests(self, session, queue, writer):
+        loop = asyncio.get_running_loop()
+        connected = True
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            line, received_at = item
+            request_id = None
+            try:
+                request = json.loads(line, parse_constant=reject_constant)
+                if not isinstance(request, dict):
+                    raise ValueError("a request must be a JSON object")
+                request_id = request.get("id")
+                op = request.get("op", "run")
+                if op == "run":
+                    result, error = await loop.run_in_executor(self._executor, evaluate, session, request)
+                elif op == "stats":
+                    result, error = self._stats.as_dict(), None
+                else:
+                    result, error = None, f"Invalid request: unknown op '{op}'"
+            except ValueError as exception:
+                result, error = None, f"Invalid request: {exception}"
+
+            latency = time.perf_counter() - received_at
+            self._stats._queue_depth -= 1
+            try:
+                reply = json.dumps({"id": request_id, "result": result, "error": error, "latency": latency},
+                                   allow_nan=False)
+            except (ValueError, TypeError) as exception:
+                error = f"Invalid reply: {exception}"
+                reply = json.dumps({"id": request_id, "result": None, "error": error, "latency": latency})
+            self._stats.record(latency, error is not None)
+            if not connected:
+                continue
+            try:
+                writer.write(reply.encode("utf-8") + b"\n")
+                await writer.drain()
+            except ConnectionError:
+                # Remaining requests are drained without replies
+                connected = False
+
+    async def start_tcp(self, host, port):
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE, backlog=4096)
+
+    async def start_unix(self, path):
+        return await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_LINE, backlog=4096)
+
+
+async def serve(host, port, unix_path=None, workers=None, limits=None):
+    server = EvaluationServer(ThreadPoolExecutor(workers), limits=limits)
+    if unix_path:
+        listener = await server.start_unix(unix_path)
+    else:
+        listener = await server.start_tcp(host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="BASIC evaluation server, newline delimited JSON")
+    arguments.add_argument("--host", default="127.0.0.1")
+    arguments.add_argument("--port", type=int, default=8765)
+    arguments.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    arguments.add_argument("--workers", type=int, help="evaluation threads")
+    arguments.add_argument("--max-steps", type=int, help="node visits allowed per request")
+    arguments.add_argument("--timeout", type=float, help="seconds of evaluation allowed per request")
+    arguments.add_argument("--max-int-bits", type=int, help="bit length allowed for an integer result "
+                           f"(default {DEFAULT_MAX_INT_BITS} with --max-steps or --timeout)")
+    options = arguments.parse_args()
+    limits = None
+    if options.max_steps is not None or options.timeout is not None or options.max_int_bits is not None:
+        limits = Limits(options.max_steps, options.timeout, options.max_int_bits)
+    try:
+        asyncio.run(serve(options.host, options.port, options.unix, options.workers, limits))
+    except KeyboardInterrupt:
+        pass
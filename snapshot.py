@@ -0,0 +1,148 @@
+#########################
+# SNAPSHOT
+#########################
+
+"""
+Snapshots of the variables of a symbol table, saved to a file and loaded
+back in one read, so a worker starts with a large set of variables without
+running the VAR statements that built them:
+
+    >> session.save_snapshot("warm.snap")            # snapshot.save(symbol_table, path)
+    ...
+    >> session = basic.Session(snapshot.load("warm.snap"))
+
+A snapshot is HEADER followed by the names and the values of the variables
+as two columns dumped with marshal, which keeps ints of any size, floats
+and complexes exactly. load memory maps the file and hands the mapping to
+marshal.loads, so the file is never copied into a bytes object. A snapshot
+whose names are not all strings, or whose values are not all ints, floats
+and complexes, is damaged (ValueError).
+
+Loading does not box the values: a SnapshotTable keeps them as they were
+loaded and builds a new Number of a variable each time it is read, so
+loading costs about one marshal.loads whatever the number of variables.
+Reads never write to the table, only set and remove do.
+Positions are not saved, a restored Number has none (programs only read
+the value of a variable, the positions of a stored Number are never
+rendered).
+
+A SnapshotTable is a SymbolTable. As the symbol table of a session,
+assignments of the session go to it. As the parent of the symbol tables of
+several sessions, like interpreter.BUILTINS, it is shared read-only and
+each session's assignments shadow it in that session's table only:
+
+    >> shared = snapshot.load("warm.snap")
+    >> sessions = [basic.Session(interpreter.SymbolTable(shared)) for _ in range(8)]
+
+Loaded before os.fork(), the values are shared by the forked workers
+until they write to the pages holding them; gc.freeze() in the parent
+keeps the collector of each worker from writing to them.
+
+save writes the variables of a table and of its parents, the nearest
+table winning, except interpreter.BUILTINS. The file is written to a
+temporary file renamed over it, so a loader never sees half a snapshot.
+"""
+
+import marshal
+import mmap
+import os
+import tempfile
+
+from interpreter import BUILTINS, Number, SymbolTable
+
+MAGIC = b"BASS"
+FORMAT_VERSION = 1
+HEADER = MAGIC + FORMAT_VERSION.to_bytes(2, "little")
+
+# Types of the values of a snapshot, those the engines compute
+VALUE_TYPES = {int, float, complex}
+
+
+class SnapshotTable(SymbolTable):
+    def __init__(self, names, values, parent=BUILTINS):
+        super().__init__(parent)
+        # Loaded values not assigned since, boxed when read
+        self._values = dict(zip(names, values))
+
+    def get(self, variable_name):
+        value = self._symbols.get(variable_name, None)
+        if value is None:
+            loaded = self._values.get(variable_name, None)
+            if loaded is not None:
+                # Not cached, a shared table is read by several threads
+                # and forked workers
+                return Number(loaded)
+            if self._parent:
+                return self._parent.get(variable_name)
+        return value
+
+    def set(self, variable_name, value):
+        self._values.pop(variable_name, None)
+        self._symbols[variable_name] = value
+
+    def remove(self, variable_name):
+        if self._values.pop(variable_name, None) is None:
+            del self._symbols[variable_name]
+
+    def defines(self, variable_name):
+        return variable_name in self._symbols or variable_name in self._values
+
+
+def table_values(symbol_table):
+    # Name -> value of the variables of the table and its parents
+    tables = []
+    while symbol_table is not None and symbol_table is not BUILTINS:
+        tables.append(symbol_table)
+        symbol_table = symbol_table._parent
+    values = {}
+    for table in reversed(tables):
+        if isinstance(table, SnapshotTable):
+            values.update(table._values)
+        values.update((name, number._value) for name, number in table._symbols.items())
+    return values
+
+
+def dumps(symbol_table):
+    values = table_values(symbol_table)
+    return HEADER + marshal.dumps((tuple(values), tuple(values.values())))
+
+
+def loads(buffer, parent=BUILTINS):
+    if bytes(buffer[:len(HEADER)]) != HEADER:
+        raise ValueError("not a snapshot of this format")
+    try:
+        names, values = marshal.loads(buffer[len(HEADER):])
+    except (EOFError, TypeError) as error:
+        raise ValueError(f"damaged snapshot: {error}")
+    if type(names) is not tuple or type(values) is not tuple or len(names) != len(values):
+        raise ValueError("damaged snapshot: columns of different lengths")
+    # Checked by type in C, marshal loads any of its types (strings, lists, code)
+    if not set(map(type, names)) <= {str} or not set(map(type, values)) <= VALUE_TYPES:
+        raise ValueError("damaged snapshot: names or values of the wrong type")
+    return SnapshotTable(names, values, parent)
+
+
+def save(symbol_table, path):
+    blob = dumps(symbol_table)
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(".tmp", ".", directory)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(blob)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def load(path, parent=BUILTINS):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < len(HEADER):
+            raise ValueError("not a snapshot of this format")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return loads(view, parent)
+            finally:
+                # The mapping cannot close while a view of it is alive
+                view.release()
@@ -3,6 +3,8 @@
 #########################
 import string
 
+from position import Position
+
 DIGITS = "0123456789"
 LETTERS = string.ascii_letters
 ALPHANUMERIC = LETTERS + DIGITS
@@ -25,6 +27,7 @@ class TokenTypes:
     TT_EQ = "EQ"
     TT_LPAREN = "LPAREN"
     TT_RPAREN = "RPAREN"
+    TT_NEWLINE = "NEWLINE"
     TT_EOF = "EOF"
 
 
@@ -33,15 +36,18 @@ class TokenTypes:
 #########################
 
 class TokenObj:
+    # Offsets into self._source, Position objects are only built on request
+    __slots__ = ("_type", "_value", "_start", "_end", "_source")
+
     def __init__(self, t_type, t_value=None, start_pos=None, end_pos=None):
         self._type = t_type
         self._value = t_value
         if start_pos:
-            self._start_pos = start_pos.copy()
-            self._end_pos = start_pos.copy()
-            self._end_pos.advance()
+            self._source = start_pos._source
+            self._start = start_pos._indx
+            self._end = start_pos._indx + 1
         if end_pos:
-            self._end_pos = end_pos.copy()
+            self._end = end_pos._indx
 
     def get_type(self):
         return self._type
@@ -49,11 +55,20 @@ class TokenObj:
     def get_value(self):
         return self._value
 
+    def get_source(self):
+        return self._source
+
+    def get_start(self):
+        return self._start
+
+    def get_end(self):
+        return self._end
+
     def get_start_pos(self):
-        return self._start_pos
+        return Position(self._start, self._source)
 
     def get_end_pos(self):
-        return self._end_pos
+        return Position(self._end, self._source)
 
     def matches(self, token_type, value):
         return self._type == token_type and self._value == value
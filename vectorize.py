@@ -0,0 +1,180 @@
+#########################
+# VECTORIZED EVALUATION
+#########################
+
+"""
+Evaluates one parsed program over many rows of variable bindings at once.
+
+Instead of running the interpreter once per row, every node is evaluated
+once over whole NumPy arrays:
+
+    >> ast = parser.exec_parser(lexer.exec_lexer('<batch>', 'a * 2 / b')[0])
+    >> result = exec_vectorized(ast, {'a': np.array([1, 2, 3]), 'b': np.array([1, 0, 2])})
+    >> result.get_values()
+    array([ 2., nan,  3.])
+    >> result.error_at(1).as_string()
+    Runtime Error: Division by Zero. ...
+
+Rows that fail (division by zero, undefined variable) get NaN as value and
+remember which error stopped them, in evaluation order, so error_at(row)
+returns the same RTError the interpreter would give for that row.
+VAR assignments bind per row values for the rest of the program only, they
+are not written back to the global symbol table.
+
+Differences with the interpreter that come from NumPy itself:
+    - a column has a single dtype, so an int ** int column with any negative
+      exponent is computed as float for every row
+    - integers are fixed width (int64) and wrap around instead of growing
+    - a negative base with a fractional exponent gives NaN, not a complex
+    - 0 to a negative power fails the row with a RTError at the power, where
+      the interpreter raises Python's ZeroDivisionError
+"""
+
+from compiler import value_positions
+from errors import RTError
+from interpreter import make_program_context
+from tokens import TokenTypes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NO_ERROR = -1
+
+
+class BatchResult:
+    def __init__(self, values, error_index, error_sites, context):
+        self._values = values
+        self._error_index = error_index
+        self._error_sites = error_sites
+        self._context = context
+
+    def get_values(self):
+        return self._values
+
+    def get_error_index(self):
+        return self._error_index
+
+    def get_error_mask(self):
+        return self._error_index != NO_ERROR
+
+    def error_at(self, row):
+        site = self._error_index[row]
+        if site == NO_ERROR:
+            return None
+        start_pos, end_pos, details = self._error_sites[site]
+        return RTError(start_pos, end_pos, details, self._context)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class VectorizedInterpreter:
+    def __init__(self, bindings, size, context):
+        self._variables = dict(bindings)
+        self._size = size
+        self._context = context
+        self._error_index = np.full(size, NO_ERROR, dtype=np.int32)
+        self._error_sites = []
+        # Value of each CachedNode evaluated so far, by index
+        self._cached = {}
+
+    def fail(self, mask, start_pos, end_pos, details):
+        # Only rows that have not failed yet: the interpreter stops at the first error
+        mask = mask & (self._error_index == NO_ERROR)
+        if mask.any():
+            self._error_index[mask] = len(self._error_sites)
+            self._error_sites.append((start_pos, end_pos, details))
+
+    def no_visit_method(self, node):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+
+    def visit_NumberNode(self, node):
+        return node.get_token().get_value()
+
+    def visit_VariableAccessNode(self, node):
+        var_name = node.get_token().get_value()
+        value = self._variables.get(var_name)
+        if value is not None:
+            return value
+        number = self._context._symbol_table.get(var_name)
+        if number is not None:
+            return number._value
+        self.fail(np.ones(self._size, dtype=bool), node.get_start_pos(), node.get_end_pos(),
+                  f"'{var_name}' is not defined.")
+        return np.nan
+
+    def visit_VariableAssignNode(self, node):
+        value = self.evaluate(node.get_value_node())
+        self._variables[node.get_token().get_value()] = value
+        return value
+
+    def visit_UnaryOpNode(self, node):
+        value = self.evaluate(node._node)
+        if node.get_token().get_type() == TokenTypes.TT_MINUS:
+            return value * -1
+        return value
+
+    def visit_CachedNode(self, node):
+        value = self._cached[node._index] = self.evaluate(node._node)
+        return value
+
+    def visit_ReusedNode(self, node):
+        return self._cached[node._cached._index]
+
+    def visit_BinaryOpNode(self, node):
+        left = self.evaluate(node.get_left_node())
+        right = self.evaluate(node.get_right_node())
+
+        op_type = node.get_token().get_type()
+        if op_type == TokenTypes.TT_PLUS:
+            return left + right
+        if op_type == TokenTypes.TT_MINUS:
+            return left - right
+        if op_type == TokenTypes.TT_MUL:
+            return left * right
+        if op_type == TokenTypes.TT_DIV:
+            zero = np.broadcast_to(np.asarray(right) == 0, (self._size,))
+            if zero.any():
+                start_pos, end_pos = value_positions(node.get_right_node())
+                self.fail(zero, start_pos, end_pos, "Division by Zero")
+                right = np.where(zero, 1, right)
+                return np.where(zero, np.nan, left / right)
+            return left / right
+        if op_type == TokenTypes.TT_POWER:
+            left_array, right_array = np.asarray(left), np.asarray(right)
+            zero_base = np.broadcast_to((left_array == 0) & (right_array < 0), (self._size,))
+            if zero_base.any():
+                self.fail(zero_base, node.get_start_pos(), node.get_end_pos(), "0 cannot be raised to a negative power")
+            if left_array.dtype.kind in "iu" and right_array.dtype.kind in "iu" and (right_array < 0).any():
+                return left_array.astype(np.float64) ** right_array
+            return left ** right
+        raise Exception(f"Unknown operator {op_type}")
+
+    def evaluate(self, node):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+
+def exec_vectorized(abstract_syntax_tree, bindings):
+    if np is None:
+        raise ImportError("Vectorized evaluation requires numpy")
+
+    bindings = {name: np.asarray(values) for name, values in bindings.items()}
+    sizes = {len(values) for values in bindings.values()}
+    if len(sizes) > 1:
+        raise ValueError("All bound arrays must have the same length")
+    size = sizes.pop() if sizes else 1
+
+    context = make_program_context()
+    interpreter = VectorizedInterpreter(bindings, size, context)
+    with np.errstate(all="ignore"):
+        values = interpreter.evaluate(abstract_syntax_tree._node)
+        values = np.array(np.broadcast_to(values, (size,)))
+        failed = interpreter._error_index != NO_ERROR
+        if failed.any():
+            values = values.astype(np.float64)
+            values[failed] = np.nan
+    return BatchResult(values, interpreter._error_index, interpreter._error_sites, context)
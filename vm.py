@@ -0,0 +1,122 @@
+#########################
+# VM
+#########################
+
+"""
+A loop based stack machine running the bytecode produced by compiler.py.
+
+Values on the stack are plain int / float objects; only values that leave
+the VM (assigned variables and the final result) are wrapped in a Number.
+
+The compiler numbers the names of a program, and the VM keeps variables in
+a frame indexed by those numbers (see resolver.py), loaded from the symbol
+table when it starts and written back when it stops.
+"""
+
+from compiler import OpCodes
+from errors import RTError
+from limits import LimitExceeded
+from interpreter import (
+    Number,
+    make_program_context
+)
+from resolver import load_frame
+
+
+class VM:
+    def run(self, code, context, budget=None):
+        instructions = code.get_instructions()
+        constants = code.get_constants()
+        names = code.get_names()
+        positions = code.get_positions()
+        if budget is not None:
+            try:
+                budget.spend(code.get_node_count())
+            except LimitExceeded as error:
+                start_pos, end_pos = positions[-1]
+                return None, RTError(start_pos, end_pos, error.get_details(), context)
+        frame = load_frame(names, context._symbol_table)
+        # Positions of the last STORE_NAME of each name, None while it is not assigned
+        stored = [None] * len(names)
+        temps = [None] * code.get_temp_count()
+        try:
+            return self.execute(instructions, constants, names, positions, frame, stored, temps, budget, context)
+        finally:
+            # Assignments made before an error are kept
+            for indx, store_positions in enumerate(stored):
+                if store_positions is not None:
+                    start_pos, end_pos = store_positions
+                    number = Number(frame[indx]).set_context(context).set_position(start_pos, end_pos)
+                    context._symbol_table.set(names[indx], number)
+
+    def execute(self, instructions, constants, names, positions, frame, stored, temps, budget, context):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            op = instructions[pc]
+            arg = instructions[pc + 1]
+            pc += 2
+
+            if op == OpCodes.LOAD_CONST:
+                push(constants[arg])
+            elif op == OpCodes.LOAD_NAME:
+                value = frame[arg]
+                if value is None:
+                    start_pos, end_pos = positions[pc // 2 - 1]
+                    return None, RTError(start_pos, end_pos, f"'{names[arg]}' is not defined.", context)
+                push(value)
+            elif op == OpCodes.ADD:
+                right = pop()
+                stack[-1] += right
+            elif op == OpCodes.SUB:
+                right = pop()
+                stack[-1] -= right
+            elif op == OpCodes.MUL:
+                right = pop()
+                if budget is None:
+                    stack[-1] *= right
+                else:
+                    try:
+                        stack[-1] = budget.multiply(stack[-1], right)
+                    except LimitExceeded as error:
+                        start_pos, end_pos = positions[pc // 2 - 1]
+                        return None, RTError(start_pos, end_pos, error.get_details(), context)
+            elif op == OpCodes.DIV:
+                right = pop()
+                if right == 0:
+                    start_pos, end_pos = positions[pc // 2 - 1]
+                    return None, RTError(start_pos, end_pos, "Division by Zero", context)
+                stack[-1] /= right
+            elif op == OpCodes.POW:
+                right = pop()
+                if budget is None:
+                    stack[-1] **= right
+                else:
+                    try:
+                        stack[-1] = budget.power(stack[-1], right)
+                    except LimitExceeded as error:
+                        start_pos, end_pos = positions[pc // 2 - 1]
+                        return None, RTError(start_pos, end_pos, error.get_details(), context)
+            elif op == OpCodes.NEG:
+                stack[-1] = -stack[-1]
+            elif op == OpCodes.STORE_NAME:
+                frame[arg] = stack[-1]
+                stored[arg] = positions[pc // 2 - 1]
+            elif op == OpCodes.STORE_TEMP:
+                temps[arg] = stack[-1]
+            elif op == OpCodes.LOAD_TEMP:
+                push(temps[arg])
+            elif op == OpCodes.RETURN:
+                start_pos, end_pos = positions[pc // 2 - 1]
+                return Number(pop()).set_context(context).set_position(start_pos, end_pos), None
+            else:
+                raise Exception(f"Unknown opcode {op}")
+
+
+def exec_vm(code, context=None, budget=None):
+    vm = VM()
+    if context is None:
+        context = make_program_context()
+    return vm.run(code, context, budget)